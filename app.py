@@ -1,136 +1,268 @@
 import argparse  # Add this import
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+import gc
+import hmac
+import sys
+import click
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, session, jsonify, flash, send_from_directory, Response, stream_with_context
 from classes import db, User, Project, Milestone  # Ensure these imports are present
-from werkzeug.utils import secure_filename
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import check_password_hash, generate_password_hash
-from flask_migrate import Migrate  # Ensure this is imported
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 from datetime import datetime, timedelta
 from flask_mail import Mail, Message  # Ensure Flask-Mail is installed
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+import ratelimit_storage  # Registers the sqlite:// rate-limit storage scheme
 from flask_wtf.csrf import CSRFProtect
-from authlib.integrations.flask_client import OAuth  # Update this import
-from urllib.parse import quote as url_quote  # Update this import
-import json  # Add this import
-
-app = Flask(__name__, static_folder='static')
-app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key')  # Use environment variable for secret key
-app.config['UPLOAD_DIR'] = 'static/uploads'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///collab_db.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 604800  # Cache static files for one week (in seconds)
-
-# Secure session cookies
-app.config.update(
-    SESSION_COOKIE_HTTPONLY=True,
-    SESSION_COOKIE_SECURE=True,
-    REMEMBER_COOKIE_HTTPONLY=True,
-    REMEMBER_COOKIE_DURATION=timedelta(days=14)
-)
+from oauth_login import OIDCClient, OAuthError
+import database
+import search as project_search
+from pagination import keyset_page, sort_key, InvalidCursor, DEFAULT_SORT
+from projections import parse_fields, load_columns, serialize_projects, InvalidFields, PRESETS
+from fast_json import FastJSONProvider
+from response_cache import ResponseCache
+from page_cache import PageCache
+from outbox import MailOutbox
+from metrics import Metrics
+from progress import refresh_progress, sweep, DeadlineSweeper
+from profiles import refresh_user_counts, member_ids, user_projects_page
+from project_writes import resolve_collaborators, add_milestones, sync_milestones
+from images import ImagePipeline, InvalidImage, VARIANTS, is_content_addressed, is_variant, variant_filename, make_variants
+from uploads import ResumableUploads, UploadConflict
+from compression import Compress
+from suggest import SuggestIndex, DEFAULT_LIMIT as SUGGEST_DEFAULT_LIMIT, MAX_LIMIT as SUGGEST_MAX_LIMIT
+from static_assets import StaticAssets, build as build_static_assets
+from server_session import ServerSessionInterface
+import transfer
+import changes as change_feed
+
+# Application factory.
+#
+#   app = create_app()                                       # configured from the environment
+#   app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})  # overrides, e.g. for benchmarks
+#
+# Importing this module only defines the routes and creates the extensions
+# unbound; create_app() attaches them to an app without touching the database.
+# The schema is created by `flask init-db` (or `python app.py`), the typeahead
+# index by the first /suggest request, and the OAuth HTTP client by the first
+# login. A preforking server imports wsgi.py instead, which also runs
+# warm_up() so that the workers are forked with all of that already done.
+
+# Session data is kept server-side; the cookie only carries its id
+server_sessions = ServerSessionInterface()
 
 # Initialize CSRF protection
-csrf = CSRFProtect(app)
+csrf = CSRFProtect()
+
+# Per-request timing, SQL and template instrumentation, served at /metrics
+metrics = Metrics()
+
+# Cache for JSON listing endpoints, invalidated by the project write routes
+response_cache = ResponseCache()
+
+# Periodically refresh progress aggregates of projects whose next deadline has passed
+deadline_sweeper = DeadlineSweeper()
+
+# Render cache for the static content pages
+page_cache = PageCache()
+
+# Content-addressed uploads with background thumbnail/WebP generation
+image_pipeline = ImagePipeline()
+resumable_uploads = ResumableUploads()  # Chunked uploads of large images, see uploads.py
+
+# In-memory typeahead index over project titles and usernames, served by /suggest
+suggest_index = SuggestIndex()
+
+# gzip/brotli for dynamic responses; fingerprinted, precompressed files from `flask build-static`
+compress = Compress()
+static_assets = StaticAssets()
+
+# Outbound mail is queued in the database and sent by a background thread
+mail = Mail()
+mail_outbox = MailOutbox()
+
+# Counters live in a SQLite file shared by all worker processes on the host
+# unless RATELIMIT_STORAGE_URI says otherwise
+limiter = Limiter(get_remote_address, default_limits=["200 per day", "50 per hour"])
+
+# Google OpenID Connect, pooled HTTP client, locally verified ID tokens
+google = OIDCClient()
+
+main = Blueprint('main', __name__, cli_group=None)
+
+
+def create_app(config=None):
+    app = Flask(__name__, static_folder='static')
+    app.json = FastJSONProvider(app)  # orjson when installed
+    app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key')  # Use environment variable for secret key
+    app.config['UPLOAD_DIR'] = 'static/uploads'
+    app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))  # Processes generating image variants
+    app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024  # Whole request, including all images posted with a form
+    app.config['UPLOAD_MAX_FILE_SIZE'] = 32 * 1024 * 1024  # Per image, whether posted with a form or through /uploads
+    app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024  # Bytes per PATCH suggested to resumable upload clients
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 604800  # Cache static files for one week (in seconds); fingerprinted builds are immutable
+    app.config['COMPRESS_MIN_SIZE'] = 500  # Smaller dynamic responses are sent uncompressed
+    app.config['SLOW_REQUEST_THRESHOLD_MS'] = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))  # Log slower requests with their queries
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Optional bearer token required by /metrics
+    app.config['EXPORT_TOKEN'] = os.environ.get('EXPORT_TOKEN')  # Bearer token for /export/projects.ndjson (disabled when unset)
+    app.config['DEADLINE_SWEEP_INTERVAL'] = 60  # Seconds between sweeps for milestones that became overdue
+    app.config['RESPONSE_CACHE_SIZE'] = 512  # Cached JSON listing responses per worker
+    app.config['RESPONSE_CACHE_PATH'] = os.environ.get('RESPONSE_CACHE_PATH')  # Shared SQLite file; defaults to instance/response_cache.db
+
+    # Secure session cookies
+    app.config.update(
+        SESSION_COOKIE_HTTPONLY=True,
+        SESSION_COOKIE_SECURE=True,
+        REMEMBER_COOKIE_HTTPONLY=True,
+        REMEMBER_COOKIE_DURATION=timedelta(days=14)
+    )
+    app.config['SESSION_STORE_PATH'] = os.environ.get('SESSION_STORE_PATH')  # Defaults to instance/sessions.db
+    app.config['SESSION_LIFETIME'] = 14 * 24 * 3600  # Seconds an unused session is kept
+
+    # Mail settings
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.example.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes')  # STARTTLS; off for a local relay
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your_email@example.com')  # Use environment variable for email
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your_email_password')  # Use environment variable for email password
+
+    app.config['RATELIMIT_STORAGE_URI'] = os.environ.get(
+        'RATELIMIT_STORAGE_URI', 'sqlite:///' + os.path.join(app.instance_path, 'ratelimits.db'))
+
+    # OAuth client credentials; login is unavailable until they are set
+    app.config['OAUTH_CLIENT_ID'] = os.environ.get('CLIENT_ID')
+    app.config['OAUTH_CLIENT_SECRET'] = os.environ.get('CLIENT_SECRET')
+    if os.environ.get('OAUTH_DISCOVERY_URL'):
+        app.config['OAUTH_DISCOVERY_URL'] = os.environ['OAUTH_DISCOVERY_URL']  # e.g. stub_idp.py in development
+
+    if config:
+        app.config.update(config)
+    database.configure(app)  # URI, pool settings and SQLite pragmas (WAL etc.) from the environment
+    os.makedirs(app.instance_path, exist_ok=True)  # Default home of the SQLite files
+
+    server_sessions.init_app(app)
+    csrf.init_app(app)
+    db.init_app(app)
+    database.init_app(app)
+    if click.get_current_context(silent=True) is not None:
+        # `flask db ...`: Flask-Migrate pulls in Alembic, which servers never need
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    metrics.init_app(app, db)
+    response_cache.init_app(app)
+    deadline_sweeper.init_app(app, on_change=lambda: response_cache.invalidate('projects'))
+    page_cache.init_app(app)
+    image_pipeline.init_app(app)
+    resumable_uploads.init_app(app, image_pipeline)
+    suggest_index.init_app(app)
+    compress.init_app(app)
+    static_assets.init_app(app)
+    mail.init_app(app)
+    mail_outbox.init_app(app, mail)
+    limiter.init_app(app)
+    google.init_app(app)
+
+    app.register_blueprint(main)
+    return app
+
+
+def init_db():
+    # Tables plus the search index and change log triggers; safe on an existing
+    # database. Schema changes to existing tables go through `flask db upgrade`.
+    db.create_all()
+    project_search.create_index()
+    change_feed.create_log()
 
-# Initialize the database
-db.init_app(app)
 
-with app.app_context():
-    db.create_all()
+def warm_up(app):
+    # Does ahead of time what would otherwise fall to the first requests, so
+    # that workers forked from a preloaded app share the result
+    with app.app_context():
+        suggest_index.ensure_built()
+        db.session.remove()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    google.preload()
+    # Keep the collector away from everything allocated so far: it would cost
+    # the first requests a full collection and, in forked workers, copy the
+    # shared pages it touches
+    gc.freeze()
+
+
+@main.cli.command('init-db')
+def init_db_command():
+    init_db()
+    print("Database initialized.")
+
+
+@main.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    # Repopulates the full-text index from the projects table, e.g. after a VACUUM
+    project_search.rebuild_index()
+    print("Search index rebuilt.")
 
-migrate = Migrate(app, db)  # Ensure this is initialized
-
-# Initialize Flask-Mail
-app.config['MAIL_SERVER'] = 'smtp.example.com'  # Replace with your SMTP server
-app.config['MAIL_PORT'] = 587  # Update if different
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your_email@example.com')  # Use environment variable for email
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your_email_password')  # Use environment variable for email password
-mail = Mail(app)
-
-# Initialize Flask-Limiter
-limiter = Limiter(
-    get_remote_address,
-    app=app,
-    default_limits=["200 per day", "50 per hour"]
-)
-
-# Initialize OAuth
-oauth = OAuth(app)
-google = oauth.register(
-    name='google',
-    client_id=os.environ['CLIENT_ID'],  # Use the client_id from the secret file
-    client_secret=os.environ['CLIENT_SECRET'],  # Use the client_secret from the secret file
-    authorize_url='https://accounts.google.com/o/oauth2/auth',
-    authorize_params=None,
-    access_token_url='https://accounts.google.com/o/oauth2/token',
-    access_token_params=None,
-    refresh_token_url=None,
-    redirect_uri='http://localhost:5000/login/authorized',  # Ensure this matches the registered URI
-    client_kwargs={'scope': 'email'},
-)
 
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
 
-@app.route('/')
-@app.route('/home')
+ABOUT_FILE = os.path.join('static', 'about.txt')
+
+def read_about_text():
+    with open(ABOUT_FILE, 'r', encoding='utf-8') as f:
+        return {'about_text': f.read()}
+
+@main.route('/')
+@main.route('/home')
 def homepage():
-    # Read 'about.txt' content
-    with open(os.path.join('static', 'about.txt'), 'r',encoding='utf-8') as f:
-        about_text = f.read()
-    # Pass 'about_text' to the template
-    return render_template('homepage.html', about_text=about_text)
+    # 'about.txt' is only read when the cached page is missing or stale
+    return page_cache.render('homepage.html', files=[ABOUT_FILE], context=read_about_text)
 
-@app.route('/about')
+@main.route('/about')
 def about():
-    # Read 'about.txt' content
-    with open(os.path.join('static', 'about.txt'), 'r') as f:
-        about_text = f.read()
-    # Pass 'about_text' to the template
-    return render_template('about.html', about_text=about_text)
+    return page_cache.render('about.html', files=[ABOUT_FILE], context=read_about_text)
 
-@app.route('/login')
+@main.route('/login')
 def login():
-    redirect_uri = url_for('authorized', _external=True)
-    return google.authorize_redirect(redirect_uri)
-
-@app.route('/logout')
+    redirect_uri = url_for('.authorized', _external=True)
+    try:
+        return google.authorize_redirect(redirect_uri)
+    except OAuthError as e:
+        flash(f'Login is unavailable: {e}', 'error')
+        return redirect(url_for('.homepage'))
+
+@main.route('/logout')
 def logout():
     session.pop('google_token', None)
     session.pop('username', None)
     session.pop('email', None)
-    return redirect(url_for('homepage'))
+    return redirect(url_for('.homepage'))
 
-@app.route('/login/authorized')
+@main.route('/login/authorized')
 def authorized():
-    token = google.authorize_access_token()
-    if token is None:
-        flash('Access denied: reason={} error={}'.format(
-            request.args['error_reason'],
-            request.args['error_description']
-        ), 'error')
-        return redirect(url_for('homepage'))
+    try:
+        token, claims = google.authorize()
+    except OAuthError as e:
+        flash(f'Access denied: {e}', 'error')
+        return redirect(url_for('.homepage'))
 
+    session.regenerate()  # Fresh session id for the logged-in session
     session['google_token'] = token
-    user_info = google.get('https://www.googleapis.com/oauth2/v1/userinfo').json()
-    session['email'] = user_info['email']
+    session['email'] = claims['email']
 
     user = User.query.filter_by(email=session['email']).first()
     if user:
         session['username'] = user.username
-        return redirect(url_for('homepage'))
+        return redirect(url_for('.homepage'))
     else:
-        return redirect(url_for('ask_username'))
+        return redirect(url_for('.ask_username'))
 
-@app.route('/ask-username', methods=['GET', 'POST'])
+@main.route('/ask-username', methods=['GET', 'POST'])
 def ask_username():
     if request.method == 'POST':
         username = request.form['username']
-        print(f"Received username: {username}")  # Debugging statement
+        current_app.logger.debug(f"Received username: {username}")
         if User.query.filter_by(username=username).first():
             flash('Username already taken, please choose another one.', 'error')
         else:
@@ -138,41 +270,43 @@ def ask_username():
                 user = User(username=username, email=session['email'])
                 db.session.add(user)
                 db.session.commit()
+                suggest_index.add_user(username)
                 session['username'] = username
-                print(f"User {username} added to the database")  # Debugging statement
-                return redirect(url_for('homepage'))
+                current_app.logger.debug(f"User {username} added to the database")
+                return redirect(url_for('.homepage'))
             except Exception as e:
-                print(f"Error adding user: {e}")  # Debugging statement
+                current_app.logger.exception(f"Error adding user: {e}")
                 flash('An error occurred while creating your account. Please try again.', 'error')
     return render_template('ask_username.html')
 
+def attach_images(project):
+    # Images posted with the form (already stored while the request was
+    # parsed), then completed resumable uploads referenced by id
+    rejected = []
+    for image in request.files.getlist('images'):
+        if image:
+            try:
+                project.add_image(image_pipeline.save(image))
+            except InvalidImage:
+                rejected.append(image.filename)
+    for upload_id in request.form.getlist('upload_ids'):
+        filename = resumable_uploads.claim(upload_id, session['username'])
+        if filename:
+            project.add_image(filename)
+    if rejected:
+        flash(f"Skipped files that are not images: {', '.join(rejected)}", 'error')
+
 # Post a project route
-@app.route('/post-project', methods=['GET', 'POST'])
+@main.route('/post-project', methods=['GET', 'POST'])
 def post_project():
     if 'username' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
 
     if request.method == 'POST':
         title = request.form['title']
         description = request.form['description']
         owner = session['username']
-        other_users = request.form.get('users', '').split(',')
-        invalid_usernames = []
-        valid_users = []
-
-        # Validate all usernames
-        for username in other_users:
-            username = username.strip()
-
-            if username == owner:
-                continue
-
-            if username:
-                user = User.query.filter_by(username=username).first()
-                if user:
-                    valid_users.append(user)
-                else:
-                    invalid_usernames.append(username)
+        users, invalid_usernames = resolve_collaborators(request.form.get('users', ''), owner)
 
         if invalid_usernames:
             flash(f"Invalid usernames: {', '.join(invalid_usernames)}", 'error')
@@ -181,67 +315,78 @@ def post_project():
         # Create and add the project to the session
         p = Project(title=title, description=description, owner=owner)
         db.session.add(p)
-        user = User.query.filter_by(username=owner).first()
-        if user:
-            p.users.append(user)
-        for user in valid_users:
-            if user not in p.users:
-                p.users.append(user)
-
-        if 'images' in request.files:
-            for image in request.files.getlist('images'):
-                if image and allowed_file(image.filename):
-                    filename = secure_filename(image.filename)
-                    image_path = os.path.join(app.config['UPLOAD_DIR'], filename)
-                    image.save(image_path)
-                    p.add_image(filename)
+        p.users.extend(users)
+
+        attach_images(p)
 
         # Handle milestones
-        milestones_descriptions = request.form.getlist('milestone_descriptions')
-        milestones_deadlines = request.form.getlist('milestone_deadlines')
-        for desc, dl in zip(milestones_descriptions, milestones_deadlines):
-            if desc.strip():
-                milestone = Milestone(description=desc.strip(), project_id=p.id)
-                milestone.deadline = datetime.strptime(dl, '%Y-%m-%d') if dl else None
-                milestone.completed = request.form.get('milestone_completed_new') == 'on'
-                p.milestones.append(milestone)
+        add_milestones(p, request.form.getlist('milestone_descriptions'), request.form.getlist('milestone_deadlines'),
+                       completed=request.form.get('milestone_completed_new') == 'on')
+        refresh_progress([p.id])
+        refresh_user_counts(user.id for user in users)
 
         db.session.commit()  # Commit the session after all modifications
-        return redirect(url_for('browse_projects'))
+        response_cache.invalidate('projects')
+        suggest_index.add_project(p.id, p.title)
+        return redirect(url_for('.browse_projects'))
 
     return render_template('post_project.html')
 
 # Browse projects route
-@app.route('/browse-projects')
+@main.route('/browse-projects')
 def browse_projects():
     return render_template('browse_projects.html')
 
-@app.route('/load-more-projects')
+def project_documents(projects, fields):
+    # `fields` from parse_fields(); None keeps the full documents
+    if fields is None:
+        return Project.serialize_many(projects)
+    return serialize_projects(projects, fields)
+
+@main.route('/load-more-projects')
 @limiter.exempt
+@response_cache.cached('projects')
 def load_more_projects():
-    page = request.args.get('page', 1, type=int)
     initial_load = request.args.get('initialLoad', 'false').lower() == 'true'
     items_per_page = 10 if initial_load else 5
-    projects = Project.query.order_by(Project.title).paginate(page=page, per_page=items_per_page, error_out=False).items
-    return jsonify([p.serialize() for p in projects])
-
-@app.route('/view-project/<project_id>')
+    after = request.args.get('after')
+    sort = request.args.get('sort', DEFAULT_SORT)
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': f'Unknown field: {e}'}), 400
+    query = Project.query
+
+    # Legacy page-number access; keyset cursors (`after`) are preferred
+    if 'page' in request.args and not after:
+        page = max(request.args.get('page', 1, type=int), 1)
+        if fields is not None:
+            query = query.options(load_columns(fields))
+        projects = query.order_by(Project.title, Project.id).limit(items_per_page).offset((page - 1) * items_per_page).all()
+        return jsonify(project_documents(projects, fields))
+
+    try:
+        if fields is not None:
+            # The sort column stays loaded for the next cursor
+            query = query.options(load_columns(fields, extra=[sort_key(sort, after)]))
+        projects, next_cursor = keyset_page(query, sort=sort, after=after, per_page=items_per_page)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor or sort order'}), 400
+    response = jsonify(project_documents(projects, fields))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@main.route('/view-project/<project_id>')
 def view_project(project_id):
     project = Project.query.get(project_id)
     if project:
-        # Determine milestone statuses
-        for milestone in project.milestones:
-            if milestone.completed:
-                milestone.status = 'completed'
-            elif milestone.deadline and milestone.deadline < datetime.utcnow():
-                milestone.status = 'overdue'
-            else:
-                milestone.status = 'upcoming'
+        # Milestone statuses come from Milestone.status
         return render_template('view_project.html', project=project)
     else:
         return "Project not found", 404
 
-@app.route('/edit-project/<project_id>', methods=['GET', 'POST'])
+@main.route('/edit-project/<project_id>', methods=['GET', 'POST'])
 def edit_project(project_id):
     project = Project.query.get(project_id)
     if not project:
@@ -253,41 +398,15 @@ def edit_project(project_id):
     if request.method == 'POST':
         project.title = request.form['title']
         project.description = request.form['description']
-        other_users = request.form.get('users', '').split(',')
-        invalid_usernames = []
-        valid_users = []
-
-        # Validate all usernames
-        for username in other_users:
-            username = username.strip()
-
-            if username == project.owner:
-                continue
-
-            if username:
-                user = User.query.filter_by(username=username).first()
-                if user:
-                    valid_users.append(user)
-                else:
-                    invalid_usernames.append(username)
+        # The owner is always included
+        users, invalid_usernames = resolve_collaborators(request.form.get('users', ''), project.owner)
 
         if invalid_usernames:
             flash(f"Invalid usernames: {', '.join(invalid_usernames)}", 'error')
             return render_template('edit_project.html', project=project)
 
-        # Ensure the owner is always included
-        project.users = [User.query.filter_by(username=project.owner).first()]
-        for user in valid_users:
-            if user not in project.users:
-                project.users.append(user)
-
-        if 'images' in request.files:
-            for image in request.files.getlist('images'):
-                if image and allowed_file(image.filename):
-                    filename = secure_filename(image.filename)
-                    image_path = os.path.join(app.config['UPLOAD_DIR'], filename)
-                    image.save(image_path)
-                    project.add_image(filename)
+        previous_members = member_ids(project.id)
+        project.users = users
 
         # Get milestone data from form
         milestone_ids = request.form.getlist('milestone_ids[]')
@@ -298,45 +417,23 @@ def edit_project(project_id):
         if not (len(milestone_ids) == len(milestones_descriptions) == len(milestones_deadlines)):
             flash("Mismatch in milestone data.", 'error')
             return render_template('edit_project.html', project=project)
-        
-        # Update existing milestones and add new ones
-        for idx in range(len(milestone_ids)):
-            m_id = milestone_ids[idx]
-            desc = milestones_descriptions[idx]
-            dl = milestones_deadlines[idx]
-            # Check if the milestone is marked as completed
-            is_completed = f"milestone_completed_{idx}" in request.form
-
-            if m_id:
-                # Update existing milestone
-                milestone = Milestone.query.get(int(m_id))
-                if milestone and milestone in project.milestones:
-                    milestone.description = desc.strip()
-                    milestone.deadline = datetime.strptime(dl, '%Y-%m-%d') if dl else None
-                    milestone.completed = is_completed
-            else:
-                # Add new milestone
-                if desc.strip():
-                    new_milestone = Milestone(description=desc.strip(), project_id=project.id)
-                    new_milestone.deadline = datetime.strptime(dl, '%Y-%m-%d') if dl else None
-                    new_milestone.completed = is_completed
-                    db.session.add(new_milestone)  # Add new milestone to the session
-                    db.session.flush()  # Ensure the milestone gets an ID
-                    project.milestones.append(new_milestone)
-
-        # Remove milestones that were deleted in the form
-        form_milestone_ids = [int(mid) for mid in milestone_ids if mid]
-        for milestone in project.milestones[:]:
-            if milestone.id not in form_milestone_ids:
-                project.milestones.remove(milestone)
-                db.session.delete(milestone)
+
+        attach_images(project)  # Claims the resumable uploads, so only once the form is valid
+
+        # Update, add and remove milestones as one diff against the stored set
+        completed = {idx for idx in range(len(milestone_ids)) if f"milestone_completed_{idx}" in request.form}
+        sync_milestones(project, milestone_ids, milestones_descriptions, milestones_deadlines, completed)
+        refresh_progress([project.id])
+        refresh_user_counts(set(previous_members) | {user.id for user in users})
 
         db.session.commit()
-        return redirect(url_for('view_project', project_id=project.id))
+        response_cache.invalidate('projects')
+        suggest_index.add_project(project.id, project.title)
+        return redirect(url_for('.view_project', project_id=project.id))
 
     return render_template('edit_project.html', project=project)
 
-@app.route('/remove-image/<project_id>', methods=['POST'])
+@main.route('/remove-image/<project_id>', methods=['POST'])
 def remove_image(project_id):
     project = Project.query.get(project_id)
     if not project:
@@ -348,29 +445,191 @@ def remove_image(project_id):
     image = request.form['image']
     project.remove_image(image)
     db.session.commit()
-    return redirect(url_for('edit_project', project_id=project.id))
+    response_cache.invalidate('projects')
+    return redirect(url_for('.edit_project', project_id=project.id))
 
-@app.route('/user/<username>')
+@main.route('/uploads', methods=['POST'])
+def create_upload():
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    size = (request.get_json(silent=True) or {}).get('size')
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return jsonify({'error': 'size must be a positive integer'}), 400
+    upload = resumable_uploads.create(size, session['username'])
+    response = jsonify(upload)
+    response.headers['Location'] = url_for('.upload', upload_id=upload['id'])
+    return response, 201
+
+@main.route('/uploads/<upload_id>', methods=['GET', 'PATCH'])
+@limiter.limit("2000 per hour")  # One request per chunk
+def upload(upload_id):
+    if 'username' not in session:
+        return jsonify({'error': 'Login required'}), 401
+    if request.method == 'GET':
+        status = resumable_uploads.status(upload_id, session['username'])
+    else:
+        offset = request.headers.get('Upload-Offset', '')
+        if not offset.isdigit():
+            return jsonify({'error': 'Upload-Offset header required'}), 400
+        try:
+            status = resumable_uploads.append(upload_id, session['username'], int(offset), request.stream)
+        except UploadConflict as e:
+            return jsonify({'error': 'Offset does not match the upload', 'offset': e.offset}), 409
+        except InvalidImage as e:
+            return jsonify({'error': str(e)}), 415
+    if status is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    response = jsonify(status)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@main.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    # Raised while the body is still arriving, before a route has read the form
+    if request.path.startswith('/uploads'):
+        return jsonify({'error': e.description}), 413
+    if request.method != 'POST':
+        return e.description, 413
+    max_size = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f"The upload was too large ({max_size} MB per form, "
+          f"{current_app.config['UPLOAD_MAX_FILE_SIZE'] // (1024 * 1024)} MB per image).", 'error')
+    return redirect(request.url)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+@main.route('/media/<filename>')
+@main.route('/media/<filename>/<variant>')
+@limiter.exempt
+def media(filename, variant=None):
+    upload_dir = current_app.config['UPLOAD_DIR']
+    if variant is not None and variant not in VARIANTS:
+        return "Unknown image variant", 404
+    served = filename
+    if variant is not None and os.path.exists(os.path.join(upload_dir, variant_filename(filename, variant))):
+        served = variant_filename(filename, variant)
+    response = send_from_directory(upload_dir, served)
+    # Content-addressed files never change; fallbacks are revalidated until the variant exists
+    if is_content_addressed(filename) and (variant is None or served != filename):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@main.cli.command('generate-image-variants')
+def generate_image_variants():
+    # Backfill variants for existing uploads and re-encode the page backgrounds
+    upload_dir = current_app.config['UPLOAD_DIR']
+    for filename in sorted(os.listdir(upload_dir)):
+        # Content-addressed uploads and legacy ones kept under their original name
+        if (is_content_addressed(filename) or allowed_file(filename)) and not is_variant(filename):
+            image_pipeline.schedule(filename)
+    for filename in sorted(os.listdir(os.path.join('static', 'others'))):
+        if allowed_file(filename):
+            make_variants(os.path.join('static', 'others', filename), variants=('webp',))
+    if image_pipeline.executor:
+        image_pipeline.executor.shutdown(wait=True)
+    print("Image variants generated.")
+
+@main.cli.command('build-static')
+def build_static():
+    # Run on deploy, before starting the workers
+    upload_dir = os.path.relpath(os.path.abspath(current_app.config['UPLOAD_DIR']), current_app.static_folder)
+    manifest = build_static_assets(current_app.static_folder, exclude=[upload_dir])
+    print(f"Built {len(manifest)} static files.")
+
+@main.cli.command('send-queued-mail')
+def send_queued_mail():
+    # Drain the outbox once, e.g. from cron when background sending is disabled
+    sent = mail_outbox.drain()
+    print(f"Processed {sent} queued messages.")
+
+@main.route('/user/<username>')
 def user_profile(username):
     user = User.query.filter_by(username=username).first()
     if user:
-        return render_template('user_profile.html', user=user)
+        # Counts are stored on the user row; further pages come from user_projects
+        projects, next_cursor = user_projects_page(user)
+        return render_template('user_profile.html', user=user, projects=projects, next_cursor=next_cursor)
     else:
         return "User not found", 404
 
-@app.route('/search')
+@main.route('/user/<username>/projects')
+@limiter.exempt
+@response_cache.cached('projects')
+def user_projects(username):
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    try:
+        fields = parse_fields(request.args.get('fields')) or PRESETS['profile']
+        projects, next_cursor = user_projects_page(user, after=request.args.get('after'), fields=fields)
+    except InvalidFields as e:
+        return jsonify({'error': f'Unknown field: {e}'}), 400
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    response = jsonify(serialize_projects(projects, fields))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@main.route('/search')
+@response_cache.cached('projects')
 def search():
-    query = request.args.get('q', '').lower()
-    projects = Project.query.filter(
-        (Project.title.ilike(f'%{query}%')) | 
-        (Project.description.ilike(f'%{query}%'))
-    ).all()
-    return jsonify([p.serialize() for p in projects])
-
-@app.route('/complete-milestone/<int:milestone_id>', methods=['POST'])
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', project_search.DEFAULT_LIMIT, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': f'Unknown field: {e}'}), 400
+    options = [load_columns(fields)] if fields is not None else []
+    projects = project_search.search_projects(query, limit=limit, offset=offset, options=options)
+    return jsonify(project_documents(projects, fields))
+
+@main.route('/suggest')
+@limiter.exempt
+def suggest():
+    # Answered from memory on every keystroke; the first call builds the index
+    suggest_index.ensure_built()
+    prefix = request.args.get('q', '').strip()
+    kind = request.args.get('type', 'all')
+    limit = max(1, min(request.args.get('limit', SUGGEST_DEFAULT_LIMIT, type=int), SUGGEST_MAX_LIMIT))
+    result = {}
+    if kind in ('all', 'projects'):
+        result['projects'] = suggest_index.suggest_titles(prefix, limit) if prefix else []
+    if kind in ('all', 'users'):
+        result['users'] = suggest_index.suggest_usernames(prefix, limit) if prefix else []
+    return jsonify(result)
+
+@main.route('/changes')
+@limiter.exempt
+def changes():
+    # EventSource reconnects resume from Last-Event-ID rather than the URL's cursor
+    try:
+        since = change_feed.parse_cursor(request.headers.get('Last-Event-ID') or request.args.get('since'))
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    except InvalidFields as e:
+        return jsonify({'error': f'Unknown field: {e}'}), 400
+    types = request.args.get('type', ','.join(change_feed.ENTITIES)).split(',')
+    if not set(types) <= set(change_feed.ENTITIES):
+        return jsonify({'error': 'Unknown type'}), 400
+    limit = max(1, min(request.args.get('limit', change_feed.DEFAULT_LIMIT, type=int), change_feed.MAX_LIMIT))
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        response = Response(stream_with_context(change_feed.event_stream(since, limit, types, fields)),
+                            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering events
+        return response
+    wait = max(0, min(request.args.get('wait', 0, type=float), change_feed.MAX_WAIT))
+    return jsonify(change_feed.wait_for_changes(since, limit, types, fields, wait))
+
+@main.route('/complete-milestone/<int:milestone_id>', methods=['POST'])
 def complete_milestone(milestone_id):
     if 'username' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('.login'))
     milestone = Milestone.query.get(milestone_id)
     if not milestone:
         return "Milestone not found", 404
@@ -379,14 +638,78 @@ def complete_milestone(milestone_id):
         return "You do not have permission to complete this milestone", 403
     milestone.completed = True
     milestone.completed_date = datetime.utcnow()
+    db.session.flush()
+    refresh_progress([project.id])
+    refresh_user_counts(member_ids(project.id))
     db.session.commit()
-    return redirect(url_for('view_project', project_id=project.id))
+    response_cache.invalidate('projects')
+    return redirect(url_for('.view_project', project_id=project.id))
+
+@main.cli.command('sweep-deadlines')
+def sweep_deadlines():
+    # Same as the in-process sweep; useful from cron on idle deployments
+    updated = sweep()
+    if updated:
+        response_cache.invalidate('projects')
+    print(f"Refreshed progress for {updated} projects.")
+
+@main.cli.command('refresh-progress')
+def refresh_all_progress():
+    updated = refresh_progress()
+    users = refresh_user_counts()
+    db.session.commit()
+    response_cache.invalidate('projects')
+    print(f"Refreshed progress for {updated} projects and counts for {users} users.")
+
+def has_bearer_token(token):
+    # Constant-time, so the response time does not reveal how much of it matched
+    supplied = request.headers.get('Authorization', '').encode()
+    return hmac.compare_digest(supplied, f'Bearer {token}'.encode())
 
-@app.route('/faq')
+@main.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    token = current_app.config['METRICS_TOKEN']
+    if token and not has_bearer_token(token):
+        return "Unauthorized", 401
+    return metrics.response()
+
+@main.route('/export/projects.ndjson')
+def export_projects():
+    token = current_app.config['EXPORT_TOKEN']
+    if not token:
+        return "Export is disabled", 404
+    if not has_bearer_token(token):
+        return "Unauthorized", 401
+    # Streamed batch by batch from a database cursor; never built in memory
+    response = Response(stream_with_context(transfer.export_projects()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f"attachment; filename=projects-{datetime.utcnow():%Y%m%d%H%M%S}.ndjson"
+    return response
+
+@main.cli.command('export-projects')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='File to write (default: stdout)')
+def export_projects_command(output):
+    for chunk in transfer.export_projects():
+        output.write(chunk)
+
+@main.cli.command('import-projects')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--batch-size', default=transfer.BATCH_SIZE, show_default=True, help='Projects per transaction')
+def import_projects_command(source, batch_size):
+    # Progress and per-line problems go to stderr
+    stats = transfer.import_projects(
+        source, batch_size=batch_size,
+        on_error=lambda number, message: print(f"Line {number}: {message}", file=sys.stderr),
+        on_progress=lambda stats: print(stats, file=sys.stderr, flush=True),
+    )
+    response_cache.invalidate('projects')
+    print(f"Import finished: {stats}")
+
+@main.route('/faq')
 def faq():
-    return render_template('faq.html')
+    return page_cache.render('faq.html')
 
-@app.route('/contact-us', methods=['GET', 'POST'])
+@main.route('/contact-us', methods=['GET', 'POST'])
 def contact_us():
     if request.method == 'POST':
         # Gather form data
@@ -396,18 +719,20 @@ def contact_us():
 
         # Send email (configure mail settings properly)
         msg = Message(subject=f"Contact Us Message from {name}",
-                      sender=app.config['MAIL_USERNAME'],
+                      sender=current_app.config['MAIL_USERNAME'],
                       recipients=['support@example.com'])  # Replace with your support email
         msg.body = f"From: {name} <{email}>\n\n{message_content}"
-        mail.send(msg)
+        mail_outbox.enqueue(msg)
         flash('Your message has been sent successfully!', 'success')
-        return redirect(url_for('contact_us'))
-    return render_template('contact_us.html')
+        return redirect(url_for('.contact_us'))
+    return page_cache.render('contact_us.html')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run the Flask application.')
     parser.add_argument('--debug', action='store_true', help='Run the application in debug mode')
     args = parser.parse_args()
 
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=args.debug)
-
@@ -0,0 +1,191 @@
+import time
+from flask import current_app
+from sqlalchemy import select, text
+from classes import db, Project, Milestone, Change
+from pagination import pack_cursor, unpack_cursor, InvalidCursor
+from projections import load_columns, serialize_projects
+
+# Incremental change feed over projects and milestones, served by /changes.
+#
+#   /changes?since=now                          -> {"changes": [], "cursor": ...}
+#   /changes?since=<cursor>&type=project&fields=card
+#   /changes?since=<cursor>&wait=25             (long poll)
+#   Accept: text/event-stream                   (server-sent events)
+#
+# Database triggers record every insert, update and delete of a project or
+# milestone in the `changes` table under a new AUTOINCREMENT seq, replacing
+# the entity's previous row, so the table holds one row per entity (deleted
+# ones as tombstones) and reading everything after a cursor is a range scan
+# that returns each changed entity once, in the order of its latest change.
+# Like the search triggers they catch every write path, including imports,
+# seeding and the aggregate refreshes. Membership changes are recorded as a
+# change of the project. Updates that leave the serialized columns as they
+# were (e.g. a progress refresh that recomputes the same values) are not.
+#
+# SQLite has a single writer, so a seq is never committed after a higher one
+# is visible: a cursor can not skip a change. A client starts from since=0
+# (everything that exists) or since=now after loading a listing, and then
+# keeps passing the returned cursor back.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500  # Also keeps the IN (...) queries under SQLite's parameter limit
+MAX_WAIT = 25  # Seconds a long poll may wait for a change
+POLL_INTERVAL = 0.5  # Seconds between checks while waiting or streaming
+STREAM_SECONDS = 300  # An event stream ends after this; EventSource reconnects with Last-Event-ID
+HEARTBEAT_SECONDS = 15
+ENTITIES = ('project', 'milestone')
+
+# Columns whose change is visible in a serialized project or milestone
+PROJECT_COLUMNS = ('title', 'description', 'owner', 'project_images', 'category', 'deadline',
+                   'milestone_total', 'milestone_completed', 'milestone_overdue', 'next_deadline', 'progress')
+MILESTONE_COLUMNS = ('description', 'deadline', 'completed', 'completed_date', 'project_id')
+
+
+def record(entity, entity_id, project_id, deleted):
+    return f"""
+        DELETE FROM changes WHERE entity = '{entity}' AND entity_id = {entity_id};
+        INSERT INTO changes (entity, entity_id, project_id, deleted, changed_at)
+        VALUES ('{entity}', {entity_id}, {project_id}, {deleted}, strftime('%Y-%m-%d %H:%M:%f', 'now'));"""
+
+
+def changed(columns):
+    return ' OR '.join(f'old.{column} IS NOT new.{column}' for column in columns)
+
+
+CHANGE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS changes_projects_ai AFTER INSERT ON projects BEGIN
+        {record('project', 'new.id', 'new.id', 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_projects_au AFTER UPDATE ON projects WHEN {changed(PROJECT_COLUMNS)} BEGIN
+        {record('project', 'new.id', 'new.id', 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_projects_ad AFTER DELETE ON projects BEGIN
+        {record('project', 'old.id', 'old.id', 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_milestones_ai AFTER INSERT ON milestones BEGIN
+        {record('milestone', 'CAST(new.id AS TEXT)', 'new.project_id', 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_milestones_au AFTER UPDATE ON milestones WHEN {changed(MILESTONE_COLUMNS)} BEGIN
+        {record('milestone', 'CAST(new.id AS TEXT)', 'new.project_id', 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_milestones_ad AFTER DELETE ON milestones BEGIN
+        {record('milestone', 'CAST(old.id AS TEXT)', 'old.project_id', 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_members_ai AFTER INSERT ON project_users
+        WHEN EXISTS (SELECT 1 FROM projects WHERE id = new.project_id) BEGIN
+        {record('project', 'new.project_id', 'new.project_id', 0)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS changes_members_ad AFTER DELETE ON project_users
+        WHEN EXISTS (SELECT 1 FROM projects WHERE id = old.project_id) BEGIN
+        {record('project', 'old.project_id', 'old.project_id', 0)}
+    END""",
+]
+
+# Entities that predate the triggers, oldest change first
+BACKFILL = [
+    """INSERT INTO changes (entity, entity_id, project_id, deleted, changed_at)
+    SELECT 'project', p.id, p.id, 0, coalesce(p.last_updated, p.date_created, CURRENT_TIMESTAMP) FROM projects p
+    WHERE NOT EXISTS (SELECT 1 FROM changes c WHERE c.entity = 'project' AND c.entity_id = p.id)
+    ORDER BY p.last_updated, p.id""",
+    """INSERT INTO changes (entity, entity_id, project_id, deleted, changed_at)
+    SELECT 'milestone', CAST(m.id AS TEXT), m.project_id, 0, coalesce(m.completed_date, CURRENT_TIMESTAMP) FROM milestones m
+    WHERE NOT EXISTS (SELECT 1 FROM changes c WHERE c.entity = 'milestone' AND c.entity_id = CAST(m.id AS TEXT))
+    ORDER BY m.id""",
+]
+
+
+def feed_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def create_log():
+    # Part of `flask init-db`; safe to run on an existing database
+    if not feed_available():
+        return
+    with db.engine.begin() as conn:
+        for statement in CHANGE_TRIGGERS + BACKFILL:
+            conn.execute(text(statement))
+
+
+def parse_cursor(token):
+    # Returns the seq to read after: 0 (or no cursor) is the start of the
+    # feed, 'now' its current end
+    if not token or token == '0':
+        return 0
+    if token == 'now':
+        return db.session.scalar(select(db.func.max(Change.seq))) or 0
+    seq, = unpack_cursor(token, 1)
+    if not isinstance(seq, int) or seq < 0:
+        raise InvalidCursor(token)
+    return seq
+
+
+def read_changes(since, limit=DEFAULT_LIMIT, types=ENTITIES, fields=None):
+    # One page of the feed after `since`. Project documents are the full
+    # Project.serialize() unless `fields` (from parse_fields) says otherwise.
+    rows = db.session.execute(
+        select(Change).where(Change.seq > since, Change.entity.in_(types)).order_by(Change.seq).limit(limit + 1)
+    ).scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    project_ids = [row.entity_id for row in rows if row.entity == 'project' and not row.deleted]
+    milestone_ids = [int(row.entity_id) for row in rows if row.entity == 'milestone' and not row.deleted]
+    projects = {}
+    if project_ids:
+        query = Project.query.filter(Project.id.in_(project_ids))
+        if fields is None:
+            found = query.all()
+            projects = dict(zip((p.id for p in found), Project.serialize_many(found)))
+        else:
+            found = query.options(load_columns(fields)).all()
+            projects = dict(zip((p.id for p in found), serialize_projects(found, fields)))
+    milestones = {}
+    if milestone_ids:
+        milestones = {m.id: m.serialize() for m in Milestone.query.filter(Milestone.id.in_(milestone_ids))}
+
+    changes = []
+    for row in rows:
+        entry = {'seq': row.seq, 'type': row.entity, 'id': row.entity_id, 'project_id': row.project_id,
+                 'changed_at': row.changed_at.isoformat(), 'deleted': row.deleted, 'data': None}
+        if row.entity == 'milestone':
+            entry['id'] = int(row.entity_id)
+        if not row.deleted:
+            # Gone since this page was read: its tombstone follows later in the feed
+            entry['data'] = projects.get(row.entity_id) if row.entity == 'project' else milestones.get(entry['id'])
+            entry['deleted'] = entry['data'] is None
+        changes.append(entry)
+    last_seq = rows[-1].seq if rows else since
+    return {'changes': changes, 'cursor': pack_cursor([last_seq]), 'has_more': has_more}, last_seq
+
+
+def wait_for_changes(since, limit, types, fields, timeout):
+    # Long poll: returns as soon as there is something after `since`, or an
+    # empty page after `timeout` seconds. The database connection goes back
+    # to the pool between checks.
+    deadline = time.monotonic() + timeout
+    while True:
+        page, _ = read_changes(since, limit, types, fields)
+        if page['changes'] or time.monotonic() >= deadline:
+            return page
+        db.session.rollback()
+        time.sleep(POLL_INTERVAL)
+
+
+def event_stream(since, limit, types, fields):
+    # One `changes` event per page; the event id is the cursor after it
+    yield f'retry: {int(POLL_INTERVAL * 6000)}\n\n'
+    end = time.monotonic() + STREAM_SECONDS
+    last_sent = time.monotonic()
+    while time.monotonic() < end:
+        page, since = read_changes(since, limit, types, fields)
+        db.session.rollback()
+        if page['changes']:
+            yield f"id: {page['cursor']}\nevent: changes\ndata: {current_app.json.dumps(page)}\n\n"
+            last_sent = time.monotonic()
+            if page['has_more']:
+                continue
+        elif time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(POLL_INTERVAL)
@@ -3,12 +3,21 @@ import hashlib
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime
+from images import image_urls
 
 db = SQLAlchemy()
 
+
+def isoformat(value):
+    return value.isoformat() if value else None
+
 project_users = db.Table('project_users',
     db.Column('project_id', db.String(64), db.ForeignKey('projects.id'), primary_key=True),
-    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Column('joined_at', db.DateTime, nullable=False, default=datetime.utcnow),
+    # User.projects and the profile listing (newest first, keyset on joined_at, project_id);
+    # the primary key covers project_id lookups
+    db.Index('ix_project_users_user_joined', 'user_id', 'joined_at', 'project_id')
 )
 
 class User(db.Model):
@@ -16,6 +25,10 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)  # Add email field
+    # Profile counts maintained by profiles.py
+    projects_owned = db.Column(db.Integer, nullable=False, default=0)
+    projects_joined = db.Column(db.Integer, nullable=False, default=0)  # Member of, owned by someone else
+    milestones_completed = db.Column(db.Integer, nullable=False, default=0)  # Across the user's projects
     projects = db.relationship('Project', secondary=project_users, backref=db.backref('users', lazy=True))
 
     def __init__(self, username, email):
@@ -23,10 +36,13 @@ class User(db.Model):
         self.email = email
 
     def serialize(self):
+        # The project list is paginated separately (/user/<username>/projects)
         return {
             'username': self.username,
             'email': self.email,
-            'projects': [project.serialize() for project in self.projects]
+            'projects_owned': self.projects_owned,
+            'projects_joined': self.projects_joined,
+            'milestones_completed': self.milestones_completed
         }
 
 class Milestone(db.Model):
@@ -36,7 +52,7 @@ class Milestone(db.Model):
     deadline = db.Column(db.DateTime, nullable=True)
     completed = db.Column(db.Boolean, default=False)
     completed_date = db.Column(db.DateTime, nullable=True)
-    project_id = db.Column(db.String(64), db.ForeignKey('projects.id'), nullable=False)
+    project_id = db.Column(db.String(64), db.ForeignKey('projects.id'), nullable=False, index=True)
 
     def __init__(self, description, project_id, deadline=None, completed=False):
         self.description = description
@@ -44,17 +60,71 @@ class Milestone(db.Model):
         self.deadline = deadline
         self.completed = completed
 
+    @property
+    def status(self):
+        if self.completed:
+            return 'completed'
+        elif self.deadline and self.deadline < datetime.utcnow():
+            return 'overdue'
+        return 'upcoming'
+
     def serialize(self):
         return {
             'id': self.id,
             'description': self.description,
-            'deadline': self.deadline.isoformat() if self.deadline else None,
+            'deadline': isoformat(self.deadline),
             'completed': self.completed,
-            'completed_date': self.completed_date.isoformat() if self.completed_date else None
+            'completed_date': isoformat(self.completed_date)
         }
 
+class OutboxMessage(db.Model):
+    __tablename__ = 'mail_outbox'
+    __table_args__ = (
+        db.Index('ix_mail_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    reply_to = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, sent or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(32), nullable=True)  # Lease token of the sender working on it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class Change(db.Model):
+    # Latest change to each project and milestone, written by the triggers in
+    # changes.py. A change replaces the entity's previous row under a new seq.
+    __tablename__ = 'changes'
+    __table_args__ = (
+        db.UniqueConstraint('entity', 'entity_id', name='uq_changes_entity'),
+        db.Index('ix_changes_entity_seq', 'entity', 'seq'),  # Feeds filtered by type
+        {'sqlite_autoincrement': True},  # seqs are never reused, so cursors only move forward
+    )
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)  # 'project' or 'milestone'
+    entity_id = db.Column(db.String(64), nullable=False)
+    project_id = db.Column(db.String(64), nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)  # Tombstone
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 class Project(db.Model):
     __tablename__ = 'projects'
+    # Composite indexes backing the keyset pagination orders in pagination.py
+    __table_args__ = (
+        db.Index('ix_projects_title_id', 'title', 'id'),
+        db.Index('ix_projects_date_created_id', 'date_created', 'id'),
+        db.Index('ix_projects_last_updated_id', 'last_updated', 'id'),
+        db.Index('ix_projects_deadline_id', 'deadline', 'id'),
+        db.Index('ix_projects_owner', 'owner'),
+        db.Index('ix_projects_next_deadline_id', 'next_deadline', 'id'),
+        db.Index('ix_projects_progress_id', 'progress', 'id'),
+    )
     id = db.Column(db.String(64), primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -64,6 +134,12 @@ class Project(db.Model):
     category = db.Column(db.String(50), nullable=True)
     deadline = db.Column(db.DateTime, nullable=True)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Milestone aggregates maintained by progress.py
+    milestone_total = db.Column(db.Integer, nullable=False, default=0)
+    milestone_completed = db.Column(db.Integer, nullable=False, default=0)
+    milestone_overdue = db.Column(db.Integer, nullable=False, default=0)
+    next_deadline = db.Column(db.DateTime, nullable=True)  # Earliest upcoming deadline of an open milestone
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # milestone_completed / milestone_total
     milestones = db.relationship(
         'Milestone',
         backref='project',
@@ -98,22 +174,65 @@ class Project(db.Model):
     def __str__(self):
         return f"{self.id},{self.title},{self.description},{self.owner},{self.project_images}\n"
 
-    def serialize(self):
+    def serialize(self, usernames=None, milestones=None):
+        if usernames is None:
+            usernames = [user.username for user in self.users]
+        if milestones is None:
+            milestones = self.milestones
         return {
             "id": self.id,
             "title": self.title,
             "description": self.description,
             "owner": self.owner,
             "images": self.project_images,
-            "date_created": self.date_created.isoformat() if self.date_created else None,
+            "image_urls": [image_urls(image.strip()) for image in self.project_images.split(',') if image.strip()] if self.project_images else [],
+            "date_created": isoformat(self.date_created),
             "category": self.category,
-            "deadline": self.deadline.isoformat() if self.deadline else None,
-            "users": [user.username for user in self.users],
+            "deadline": isoformat(self.deadline),
+            "users": usernames,
             "last_updated": self.last_updated.strftime('%Y-%m-%d %H:%M') if self.last_updated else None,
-            "milestones": [milestone.serialize() for milestone in self.milestones]
+            "milestones": [milestone.serialize() for milestone in milestones],
+            "milestone_total": self.milestone_total,
+            "milestone_completed": self.milestone_completed,
+            "milestone_overdue": self.milestone_overdue,
+            "next_deadline": isoformat(self.next_deadline),
+            "progress": self.progress
         }
 
+    # Number of ids per IN (...) clause, kept under SQLite's bound-parameter limit
+    BATCH_SIZE = 500
+
+    @classmethod
+    def load_related(cls, ids, users=True, milestones=True):
+        # Collaborator names and Milestone objects of the given projects, as
+        # {project_id: [...]} dicts, with one IN query per BATCH_SIZE ids each
+        usernames = {pid: [] for pid in ids} if users else None
+        milestone_lists = {pid: [] for pid in ids} if milestones else None
+        for start in range(0, len(ids), cls.BATCH_SIZE):
+            chunk = ids[start:start + cls.BATCH_SIZE]
+            if users:
+                rows = db.session.query(project_users.c.project_id, User.username).join(
+                    User, User.id == project_users.c.user_id
+                ).filter(project_users.c.project_id.in_(chunk))
+                for project_id, username in rows:
+                    usernames[project_id].append(username)
+            if milestones:
+                for milestone in Milestone.query.filter(Milestone.project_id.in_(chunk)).order_by(Milestone.id):
+                    milestone_lists[milestone.project_id].append(milestone)
+        return usernames, milestone_lists
+
+    @classmethod
+    def serialize_many(cls, projects):
+        # Serialize a whole result set with two extra queries (collaborators and
+        # milestones fetched with IN over the page's ids) instead of two per project
+        projects = list(projects)
+        usernames, milestones = cls.load_related([p.id for p in projects])
+        return [p.serialize(usernames=usernames[p.id], milestones=milestones[p.id]) for p in projects]
+
     def add_image(self, image_path):
+        # Uploads are content-addressed, so the same picture twice is one image
+        if self.project_images and image_path in self.project_images.split(','):
+            return
         if self.project_images:
             self.project_images += f",{image_path}"
         else:
@@ -0,0 +1,101 @@
+import gzip
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli  # Optional: pip install Brotli
+except ImportError:
+    brotli = None
+
+# Negotiated compression of dynamic responses (HTML pages, JSON listings).
+#
+# Responses at least COMPRESS_MIN_SIZE bytes long with a compressible mimetype
+# are sent with brotli when the client accepts it and the module is installed,
+# gzip otherwise. Files sent with send_file (uploads, precompressed static
+# assets) and streamed responses (exports) pass through untouched.
+#
+# Listing and page bodies repeat a lot between requests, so compressed bodies
+# are remembered by (ETag, encoding) and reused. A compressed response keeps
+# the ETag of its uncompressed body but as a weak validator, which is all
+# If-None-Match needs and is what the response cache compares against.
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+
+def accepted_encodings():
+    return {value for value, quality in request.accept_encodings if quality > 0}
+
+
+class Compress:
+    def __init__(self, app=None):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.gzip_level = app.config.get('COMPRESS_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 5)
+        self.max_size = app.config.get('COMPRESS_CACHE_SIZE', 256)
+        app.after_request(self.compress)
+
+    def choose_encoding(self):
+        accepted = accepted_encodings()
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def encode(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def compress(self, response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (etag, encoding) if etag and not weak else None
+        compressed = self.lookup(key) if key else None
+        if compressed is None:
+            compressed = self.encode(body, encoding)
+            if key:
+                self.remember(key, compressed)
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def lookup(self, key):
+        with self.lock:
+            compressed = self.entries.get(key)
+            if compressed is not None:
+                self.entries.move_to_end(key)
+            return compressed
+
+    def remember(self, key, compressed):
+        with self.lock:
+            self.entries[key] = compressed
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
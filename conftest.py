@@ -0,0 +1 @@
+# Makes the top-level modules (app, classes, ...) importable from tests/
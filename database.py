@@ -0,0 +1,65 @@
+import os
+from sqlalchemy import event
+from classes import db
+
+# Engine tuning. The URI, pool settings and SQLite pragmas all come from config
+# (overridable through the environment), and the pragmas are applied to every
+# new DBAPI connection.
+#
+# WAL lets readers keep going while a project save is being written, and
+# synchronous=NORMAL is durable across application crashes under WAL. A
+# negative cache_size is in KiB.
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def configure(app):
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', 'sqlite:///collab_db.db'))
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+    for name in pragmas:
+        value = os.environ.get(f'SQLITE_{name.upper()}')
+        if value:
+            pragmas[name] = value
+    app.config.setdefault('SQLITE_PRAGMAS', pragmas)
+
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 3600),
+    }
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri != 'sqlite://' and ':memory:' not in uri:  # In-memory SQLite uses a single-connection pool
+        options['pool_size'] = env_int('DB_POOL_SIZE', 10)
+        options['max_overflow'] = env_int('DB_MAX_OVERFLOW', 20)
+        options['pool_timeout'] = env_int('DB_POOL_TIMEOUT', 30)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options)
+
+
+def init_app(app):
+    # Must run after db.init_app(app) and before the first connection is made
+    with app.app_context():
+        engine = db.engine
+    # Pooled connections opened before a fork (e.g. while preloading) must not
+    # be shared with the workers; each child starts with an empty pool
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = app.config['SQLITE_PRAGMAS']
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,26 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # Optional: pip install orjson
+except ImportError:
+    orjson = None
+
+# JSON provider behind jsonify() that encodes with orjson when it is installed.
+#
+# Output matches Flask's default provider: dates and other non-native types
+# still go through DefaultJSONProvider.default, keys are sorted when
+# sort_keys is set, and indented output (debug mode) or anything orjson
+# rejects falls back to the standard library encoder.
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent') or kwargs.get('cls'):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+        except TypeError:  # orjson.JSONEncodeError, e.g. integers beyond 64 bits
+            return super().dumps(obj, **kwargs)
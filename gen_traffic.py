@@ -1,46 +1,445 @@
-import random
-import os
-from classes import *
-from app import *
-from classes import *
+import argparse
+import hashlib
 import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import func, insert
+from classes import db, User, Project, Milestone, project_users
+from progress import refresh_progress
+from profiles import refresh_user_counts
+from app import create_app, init_db, limiter, response_cache
+
+# Dataset seeding and load replay for benchmarking.
+#
+#   python gen_traffic.py seed --projects 100000
+#   python gen_traffic.py replay --requests 5000 --output bench.json
+#   python gen_traffic.py replay --url http://localhost:5000 --concurrency 8
+#   python gen_traffic.py startup --runs 10
+#
+# `seed` bulk-inserts users, projects, collaborators and milestones built from
+# the bundled corpus (gen_traffic_corpus.json, or instance/examples.json when
+# present). `replay` drives a weighted mix of browse scrolls, searches, project
+# views, profile views, edits and milestone completions through the Flask test
+# client or against a running server, and reports throughput and latency
+# percentiles per route as JSON so results can be compared between releases.
+# The test client runs with rate limiting disabled; a live server enforces its
+# own limits, which show up as errors in the report.
+#
+# `startup` measures what a fresh process pays before serving: importing app.py,
+# create_app(), and the first and second request through the test client
+# (optionally after warm_up(), as wsgi.py does for a preloading server). Each
+# run is a new interpreter, so imports are cold apart from the OS file cache.
+
+app = create_app()
+
+CORPUS_FILE = 'gen_traffic_corpus.json'
+CATEGORIES = ['hackathons', 'game jams', 'events']
+DEFAULT_MIX = 'browse=50,search=25,view=15,edit=5,complete=5'
 
 data = []
+words = []
+images = None
+
 
 def read():
-    with open('instance/examples.json','r') as f:
-        global data
-        data = json.load(f)['projects']
+    global data, words
+    path = os.path.join('instance', 'examples.json')
+    if not os.path.exists(path):
+        path = CORPUS_FILE
+    with open(path, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    data = corpus['projects']
+    words = corpus.get('words') or sorted({w.lower() for p in data for w in p['title'].split() if len(w) > 4})
+
 
 def generate_random_string(length=10):
     letters = 'abcdefghijklmnopqrstuvwxyz'
     return ''.join(random.choice(letters) for i in range(length))
 
+
 def get_random_images(num_images=1):
-    images_path = 'static/uploads'
-    images = [img for img in os.listdir(images_path) if os.path.isfile(os.path.join(images_path, img))]
+    # The upload directory is listed once per run, not once per project
+    global images
+    if images is None:
+        images_path = app.config['UPLOAD_DIR']
+        images = [img for img in os.listdir(images_path) if os.path.isfile(os.path.join(images_path, img))] if os.path.isdir(images_path) else []
     return random.sample(images, min(num_images, len(images))) if images else []
 
-def generate_random_project():
-    rproj = random.choice(data)
-    title = rproj['title']
-    description = rproj['description']
-    owner = generate_random_string(10)
-    category = random.choice(['hackathons', 'game jams', 'events'])
-    deadline = datetime.utcnow() if random.choice([True, False]) else None
-    num_images = random.randint(1, 5)  # Randomly decide the number of images (1 to 5)
-    images = get_random_images(num_images)
-    return Project(title=title, description=description, owner=owner, category=category, deadline=deadline, project_images=','.join(images))
-
-def generate_projects(n=10):
-    projects = [generate_random_project() for _ in range(n)]
-    return projects
 
-if __name__ == "__main__":
+def seed(n_projects, n_users, milestones_per_project, batch_size):
+    # Rows are built as plain dicts and written with executemany INSERTs, with
+    # primary keys assigned here so that no RETURNING round trips are needed
     read()
+    now = datetime.utcnow()
+    salt = generate_random_string(8)
+    start = time.perf_counter()
     with app.app_context():
-        projects = generate_projects(50)
-        for proj in projects:
-            db.session.add(proj)
+        init_db()
+        first_user_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+        first_milestone_id = (db.session.query(func.max(Milestone.id)).scalar() or 0) + 1
+        user_rows = [{'id': first_user_id + i, 'username': f'{salt}_user{i}', 'email': f'{salt}_user{i}@example.com'}
+                     for i in range(n_users)]
+        for i in range(0, len(user_rows), batch_size):
+            db.session.execute(insert(User.__table__), user_rows[i:i + batch_size])
+        db.session.commit()
+
+        milestone_id = first_milestone_id
+        for batch_start in range(0, n_projects, batch_size):
+            projects, members, milestones = [], [], []
+            for i in range(batch_start, min(batch_start + batch_size, n_projects)):
+                rproj = random.choice(data)
+                owner = random.choice(user_rows)
+                created = now - timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))
+                project_id = hashlib.sha256(f"{rproj['title']}{owner['username']}{rproj['description']}{salt}{i}".encode()).hexdigest()
+                projects.append({
+                    'id': project_id,
+                    'title': f"{rproj['title']} #{i}",
+                    'description': rproj['description'],
+                    'owner': owner['username'],
+                    'project_images': ','.join(get_random_images(random.randint(0, 3))),
+                    'date_created': created,
+                    'last_updated': created + timedelta(minutes=random.randint(0, 60 * 24 * 30)),
+                    'category': random.choice(CATEGORIES),
+                    'deadline': now + timedelta(days=random.randint(-30, 180)) if random.random() < 0.6 else None,
+                })
+                collaborators = {owner['id']} | {random.choice(user_rows)['id'] for _ in range(random.randint(0, 3))}
+                members.extend({'project_id': project_id, 'user_id': user_id, 'joined_at': created} for user_id in collaborators)
+                for m in range(random.randint(0, 2 * milestones_per_project)):
+                    completed = random.random() < 0.3
+                    milestones.append({
+                        'id': milestone_id,
+                        'project_id': project_id,
+                        'description': f"Milestone {m + 1}: {' '.join(random.sample(words, 4))}",
+                        'deadline': created + timedelta(days=random.randint(1, 120)),
+                        'completed': completed,
+                        'completed_date': created + timedelta(days=random.randint(1, 60)) if completed else None,
+                    })
+                    milestone_id += 1
+            db.session.execute(insert(Project.__table__), projects)
+            db.session.execute(insert(project_users), members)
+            if milestones:
+                db.session.execute(insert(Milestone.__table__), milestones)
+            db.session.commit()
+            print(f"Seeded {batch_start + len(projects)}/{n_projects} projects", flush=True)
+        # Bulk inserts bypass the write routes, so fill in the stored aggregates
+        refresh_progress()
+        refresh_user_counts()
+        db.session.commit()
+        response_cache.invalidate('projects')  # Bulk inserts bypass the write routes' invalidation
+        # Fresh statistics so the query planner sees the new table sizes
+        db.session.execute(db.text('ANALYZE'))
         db.session.commit()
-        print(f"Generated and added {len(projects)} projects to the database.")
+    elapsed = time.perf_counter() - start
+    print(f"Seeded {n_users} users, {n_projects} projects and {milestone_id - first_milestone_id} milestones in {elapsed:.1f}s.")
+
+
+def forge_session(username):
+    # Store a server-side session for `username` and build its cookie and a
+    # matching CSRF form token, so write routes can be exercised without OAuth
+    raw_token = hashlib.sha1(os.urandom(64)).hexdigest()
+    cookie = app.session_interface.create({'username': username, 'csrf_token': raw_token})
+    form_token = URLSafeTimedSerializer(app.secret_key, salt='wtf-csrf-token').dumps(raw_token)
+    return cookie, form_token
+
+
+class TestClientTransport:
+    def __init__(self):
+        limiter.enabled = False  # 429s would make the numbers meaningless
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = app.test_client(use_cookies=False)
+        return self.local.client
+
+    def request(self, method, path, data=None, cookie=None):
+        headers = {'Cookie': f"{app.config['SESSION_COOKIE_NAME']}={cookie}"} if cookie else {}
+        response = self.client().open(path, method=method, data=data, headers=headers)
+        return response.status_code, response.get_data(), response.headers.get('X-Next-Cursor')
+
+
+class HTTPTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, data=None, cookie=None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if cookie:
+            req.add_header('Cookie', f"{app.config['SESSION_COOKIE_NAME']}={cookie}")
+        opener = urllib.request.build_opener(NoRedirect)
+        try:
+            with opener.open(req, timeout=30) as response:
+                return response.status, response.read(), response.headers.get('X-Next-Cursor')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def load_targets(sample_size):
+    # Projects (with their milestones) that views, edits and completions pick from
+    with app.app_context():
+        projects = Project.query.order_by(func.random()).limit(sample_size).all()
+        targets = []
+        for p in projects:
+            milestones = Milestone.query.filter_by(project_id=p.id).order_by(Milestone.id).all()
+            targets.append({
+                'id': p.id,
+                'owner': p.owner,
+                'title': p.title,
+                'description': p.description,
+                'users': ','.join(u.username for u in p.users),
+                'milestones': [(m.id, m.description, m.deadline.strftime('%Y-%m-%d') if m.deadline else '', m.completed)
+                               for m in milestones],
+            })
+    return targets
+
+
+class Replayer:
+    def __init__(self, transport, targets, scroll_depth):
+        self.transport = transport
+        self.targets = targets
+        self.scroll_depth = scroll_depth
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def session_for(self, username):
+        with self.lock:
+            if username not in self.sessions:
+                self.sessions[username] = forge_session(username)
+            return self.sessions[username]
+
+    def timed(self, route, method, path, data=None, cookie=None):
+        start = time.perf_counter()
+        status, body, cursor = self.transport.request(method, path, data=data, cookie=cookie)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return status, body, cursor
+
+    def browse(self):
+        # One scroll session: the first page, then follow cursors
+        _, _, cursor = self.timed('browse', 'GET', '/load-more-projects?initialLoad=true&fields=card')
+        for _ in range(self.scroll_depth - 1):
+            if not cursor:
+                break
+            _, _, cursor = self.timed('browse', 'GET', f'/load-more-projects?fields=card&after={urllib.parse.quote(cursor)}')
+
+    def search(self):
+        query = ' '.join(random.sample(words, random.choice([1, 1, 2])))
+        self.timed('search', 'GET', f'/search?q={urllib.parse.quote(query)}&limit=50&fields=card')
+
+    def view(self):
+        self.timed('view', 'GET', f"/view-project/{random.choice(self.targets)['id']}")
+
+    def profile(self):
+        self.timed('profile', 'GET', f"/user/{urllib.parse.quote(random.choice(self.targets)['owner'])}")
+
+    def edit(self):
+        target = random.choice(self.targets)
+        cookie, token = self.session_for(target['owner'])
+        form = {
+            'csrf_token': token,
+            'title': target['title'],
+            'description': target['description'],
+            'users': target['users'],
+            'milestone_ids[]': [str(m[0]) for m in target['milestones']],
+            'milestone_descriptions[]': [m[1] for m in target['milestones']],
+            'milestone_deadlines[]': [m[2] for m in target['milestones']],
+        }
+        for idx, m in enumerate(target['milestones']):
+            if m[3]:
+                form[f'milestone_completed_{idx}'] = 'on'
+        self.timed('edit', 'POST', f"/edit-project/{target['id']}", data=form, cookie=cookie)
+
+    def complete(self):
+        target = random.choice([t for t in self.targets if t['milestones']] or self.targets)
+        if not target['milestones']:
+            return
+        cookie, token = self.session_for(target['owner'])
+        milestone = random.choice(target['milestones'])
+        self.timed('complete', 'POST', f'/complete-milestone/{milestone[0]}', data={'csrf_token': token}, cookie=cookie)
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {'browse', 'search', 'view', 'profile', 'edit', 'complete'}
+    if unknown:
+        raise SystemExit(f"Unknown routes in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(replayer, wall_time):
+    routes = {}
+    total = 0
+    for route, samples in sorted(replayer.samples.items()):
+        samples.sort()
+        total += len(samples)
+        routes[route] = {
+            'requests': len(samples),
+            'errors': replayer.errors.get(route, 0),
+            'throughput_rps': round(len(samples) / wall_time, 2),
+            'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        }
+    return {'requests': total, 'wall_time_s': round(wall_time, 3), 'throughput_rps': round(total / wall_time, 2), 'routes': routes}
+
+
+def replay(n_operations, mix_spec, base_url, concurrency, scroll_depth, sample_size, seed_value):
+    read()
+    random.seed(seed_value)
+    mix = parse_mix(mix_spec)
+    transport = HTTPTransport(base_url) if base_url else TestClientTransport()
+    targets = load_targets(sample_size)
+    if not targets:
+        raise SystemExit("No projects in the database; run `python gen_traffic.py seed` first.")
+    replayer = Replayer(transport, targets, scroll_depth)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    plan = random.choices(names, weights=weights, k=n_operations)
+    plan_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with plan_lock:
+                if not plan:
+                    return
+                operation = plan.pop()
+            getattr(replayer, operation)()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_time = time.perf_counter() - start
+
+    with app.app_context():
+        dataset = {'projects': Project.query.count(), 'users': User.query.count(), 'milestones': Milestone.query.count()}
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'target': base_url or 'test-client',
+        'operations': n_operations,
+        'mix': mix,
+        'concurrency': concurrency,
+        'scroll_depth': scroll_depth,
+        'dataset': dataset,
+    }
+    report.update(summarize(replayer, wall_time))
+    return report
+
+
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app as application
+imported = time.perf_counter()
+app = application.create_app()
+created = time.perf_counter()
+timings = {'import_ms': (imported - start) * 1000, 'create_app_ms': (created - imported) * 1000}
+if sys.argv[2] == 'warm':
+    application.warm_up(app)
+    timings['warm_up_ms'] = (time.perf_counter() - created) * 1000
+application.limiter.enabled = False
+client = app.test_client()
+for name in ('first_request_ms', 'second_request_ms'):
+    request_start = time.perf_counter()
+    status = client.get(sys.argv[1]).status_code
+    timings[name] = (time.perf_counter() - request_start) * 1000
+timings['status'] = status
+print(json.dumps(timings))
+"""
+
+
+def startup(runs, path, warm):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE, path, 'warm' if warm else 'cold'],
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'runs': runs,
+        'path': path,
+        'warm_up': warm,
+        'statuses': sorted({r.pop('status') for r in results}),
+    }
+    for name in results[0]:
+        values = sorted(r[name] for r in results)
+        report[name] = {'median': round(statistics.median(values), 2), 'min': round(values[0], 2), 'max': round(values[-1], 2)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Seed benchmark data and replay traffic against the app.')
+    commands = parser.add_subparsers(dest='command')
+
+    seed_parser = commands.add_parser('seed', help='Bulk-insert users, projects and milestones')
+    seed_parser.add_argument('--projects', type=int, default=50)
+    seed_parser.add_argument('--users', type=int, help='Defaults to one user per ten projects')
+    seed_parser.add_argument('--milestones', type=int, default=3, help='Average milestones per project')
+    seed_parser.add_argument('--batch-size', type=int, default=5000)
+
+    replay_parser = commands.add_parser('replay', help='Replay a request mix and report latency per route')
+    replay_parser.add_argument('--requests', type=int, default=1000, help='Number of operations (a browse is one scroll session)')
+    replay_parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Route weights (default: {DEFAULT_MIX})')
+    replay_parser.add_argument('--url', help='Base URL of a running server; defaults to the in-process test client')
+    replay_parser.add_argument('--concurrency', type=int, default=1)
+    replay_parser.add_argument('--scroll-depth', type=int, default=5, help='Pages fetched per browse session')
+    replay_parser.add_argument('--sample-size', type=int, default=500, help='Projects used for views, edits and completions')
+    replay_parser.add_argument('--seed', type=int, default=0, help='Random seed for a reproducible mix')
+    replay_parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    startup_parser = commands.add_parser('startup', help='Time cold imports, create_app() and the first requests')
+    startup_parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to time')
+    startup_parser.add_argument('--path', default='/load-more-projects?initialLoad=true&fields=card', help='Path requested')
+    startup_parser.add_argument('--warm-up', action='store_true', help='Run warm_up() before the first request, as wsgi.py does')
+    startup_parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    args = parser.parse_args()
+    if args.command in ('replay', 'startup'):
+        if args.command == 'replay':
+            report = replay(args.requests, args.mix, args.url, args.concurrency, args.scroll_depth, args.sample_size, args.seed)
+        else:
+            report = startup(args.runs, args.path, args.warm_up)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+        else:
+            print(output)
+    else:
+        projects = getattr(args, 'projects', 50)
+        users = getattr(args, 'users', None) or max(1, projects // 10)
+        seed(projects, users, getattr(args, 'milestones', 3), getattr(args, 'batch_size', 5000))
@@ -0,0 +1,267 @@
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Image pipeline for project uploads.
+#
+# Uploads are stored under the sha256 of their content, so identical images are
+# stored once and differently named files can never overwrite each other.
+# Resized WebP variants are produced in a worker process pool after the request
+# has returned; until a variant exists /media serves the original in its place.
+#
+# Multipart file parts are not spooled by Werkzeug: UploadRequest hands the
+# form parser an IngestFile per part, which writes each chunk as it arrives to
+# a temporary file in the upload directory while hashing it, checks the magic
+# bytes of the first chunk (anything that is not a PNG, JPEG, GIF or WebP is
+# dropped, however it is named) and fails the request with 413 as soon as the
+# part grows past UPLOAD_MAX_FILE_SIZE. Storing it is then a rename, and memory
+# use does not depend on the size of the upload. MAX_CONTENT_LENGTH bounds
+# the request as a whole.
+
+# variant name -> (longest edge in pixels, file suffix)
+VARIANTS = {
+    'thumb': (480, 'thumb.webp'),
+    'webp': (1920, 'full.webp'),
+}
+WEBP_QUALITY = 80
+CHUNK_SIZE = 64 * 1024
+CONTENT_ADDRESSED_RE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+MAX_FILE_SIZE = 32 * 1024 * 1024
+SNIFF_LENGTH = 12  # Bytes needed to tell the formats below apart
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+# Returns the stored extension for the image format the data starts with, or None
+def sniff_image_type(header):
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def is_content_addressed(filename):
+    return bool(CONTENT_ADDRESSED_RE.match(filename))
+
+
+def variant_filename(filename, variant):
+    stem = filename.rsplit('.', 1)[0]
+    return f'{stem}.{VARIANTS[variant][1]}'
+
+
+def is_variant(filename):
+    return filename.endswith(tuple(f'.{suffix}' for _, suffix in VARIANTS.values()))
+
+
+def image_urls(filename):
+    urls = {'original': f'/media/{filename}'}
+    for variant in VARIANTS:
+        urls[variant] = f'/media/{filename}/{variant}'
+    return urls
+
+
+def make_variants(path, variants=tuple(VARIANTS)):
+    # Runs in a worker process; Pillow is imported here so the web workers
+    # never pay for it
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        out_dir = os.path.dirname(path)
+        for variant in variants:
+            edge, _ = VARIANTS[variant]
+            target = os.path.join(out_dir, variant_filename(os.path.basename(path), variant))
+            if os.path.exists(target):
+                continue
+            resized = img.copy()
+            resized.thumbnail((edge, edge))
+            fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as tmp:
+                resized.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+    return path
+
+
+class IngestFile:
+    # Writable file object for one uploaded file. Data goes to a temporary
+    # file in `directory` and through sha256 as it is written; a part whose
+    # first bytes are not an image is counted but no longer stored.
+    def __init__(self, directory, max_size=MAX_FILE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.header = b''
+        self.kind = None
+        self.rejected = False
+        self.digest = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge(f'Each image may be at most {self.max_size // (1024 * 1024)} MB.')
+        if len(self.header) < SNIFF_LENGTH:
+            self.header += data[:SNIFF_LENGTH - len(self.header)]
+            if len(self.header) == SNIFF_LENGTH:
+                self.sniff()
+        if not self.rejected:
+            self.digest.update(data)
+            self.file.write(data)
+        return len(data)
+
+    def sniff(self):
+        self.kind = sniff_image_type(self.header)
+        if self.kind is None and not self.rejected:
+            self.rejected = True
+            self.discard()
+
+    def seek(self, offset, whence=0):
+        return 0 if self.rejected else self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.size if self.rejected else self.file.tell()
+
+    def read(self, size=-1):
+        return b'' if self.rejected else self.file.read(size)
+
+    def flush(self):
+        if not self.rejected:
+            self.file.flush()
+
+    def finish(self):
+        # Returns the image type; raises InvalidImage when it is not one
+        if self.kind is None and not self.rejected:
+            self.sniff()  # Shorter than SNIFF_LENGTH
+        if self.rejected:
+            raise InvalidImage('Not a PNG, JPEG, GIF or WebP image')
+        self.file.close()
+        return self.kind
+
+    def commit(self, path):
+        os.chmod(self.path, 0o644)
+        os.replace(self.path, path)
+        self.path = None
+
+    def discard(self):
+        self.file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def close(self):
+        # A part that was never stored is removed with the request
+        self.discard()
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = current_app.extensions['image_pipeline'].ingest_file()
+        self.__dict__.setdefault('ingest_files', []).append(stream)
+        return stream
+
+    def close(self):
+        super().close()
+        # Also the parts of a request that failed halfway through parsing
+        for stream in self.__dict__.get('ingest_files', ()):
+            stream.close()
+
+
+class ImagePipeline:
+    def __init__(self, app=None):
+        self.upload_dir = 'static/uploads'
+        self.workers = 2
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.upload_dir = app.config['UPLOAD_DIR']
+        self.workers = app.config.get('IMAGE_WORKERS', 2)
+        self.max_file_size = app.config.get('UPLOAD_MAX_FILE_SIZE', MAX_FILE_SIZE)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        app.request_class = UploadRequest
+        app.extensions['image_pipeline'] = self
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.executor
+
+    def ingest_file(self):
+        return IngestFile(self.upload_dir, self.max_file_size)
+
+    def save(self, file_storage):
+        # Stores an uploaded image under its content address and returns the
+        # filename. Raises InvalidImage for anything that is not an image.
+        ingest = file_storage.stream
+        if not isinstance(ingest, IngestFile):  # Not parsed by UploadRequest
+            ingest = self.ingest_file()
+            try:
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    ingest.write(chunk)
+            except BaseException:
+                ingest.discard()
+                raise
+        try:
+            kind = ingest.finish()
+            filename = f'{ingest.digest.hexdigest()}.{kind}'
+            path = os.path.join(self.upload_dir, filename)
+            if os.path.exists(path):
+                ingest.discard()  # Already stored: deduplicate
+            else:
+                ingest.commit(path)
+        except BaseException:
+            ingest.discard()
+            raise
+        self.schedule(filename)
+        return filename
+
+    def store_file(self, tmp_path):
+        # Moves a completed file (e.g. a resumable upload) in the upload
+        # directory to its content address; hashed in one streaming pass
+        digest = hashlib.sha256()
+        with open(tmp_path, 'rb') as f:
+            kind = sniff_image_type(f.read(SNIFF_LENGTH))
+            if kind is None:
+                os.remove(tmp_path)
+                raise InvalidImage('Not a PNG, JPEG, GIF or WebP image')
+            f.seek(0)
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        filename = f'{digest.hexdigest()}.{kind}'
+        path = os.path.join(self.upload_dir, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        self.schedule(filename)
+        return filename
+
+    def is_stored(self, filename):
+        return is_content_addressed(filename) and os.path.exists(os.path.join(self.upload_dir, filename))
+
+    def missing_variants(self, filename):
+        return tuple(v for v in VARIANTS
+                     if not os.path.exists(os.path.join(self.upload_dir, variant_filename(filename, v))))
+
+    def schedule(self, filename):
+        variants = self.missing_variants(filename)
+        if variants:
+            self.get_executor().submit(make_variants, os.path.join(self.upload_dir, filename), variants)
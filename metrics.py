@@ -0,0 +1,164 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response
+from sqlalchemy import event
+
+# Per-request instrumentation exposed in the Prometheus text format.
+#
+# For every request we record wall time, the number and total duration of SQL
+# statements (via SQLAlchemy engine events), time spent rendering templates and
+# the response size. Requests slower than SLOW_REQUEST_THRESHOLD_MS are logged
+# together with the statements they ran. Values are kept per worker process;
+# Prometheus aggregates across workers when it scrapes each of them.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MAX_LOGGED_QUERIES = 50
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((labels, list(series)) for labels, series in self.series.items())
+        for labels, series in items:
+            base = ','.join(f'{k}="{escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = ',' if base else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {cumulative}')
+            suffix = f'{{{base}}}' if base else ''
+            lines.append(f'{self.name}_sum{suffix} {series[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            base = ','.join(f'{k}="{escape(v)}"' for k, v in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{base}}} {value}')
+        return '\n'.join(lines)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self, app=None, db=None):
+        self.request_duration = Histogram('http_request_duration_seconds', 'Wall time per request.',
+                                          LATENCY_BUCKETS, ('endpoint', 'method'))
+        self.requests = Counter('http_requests_total', 'Requests by endpoint and status.',
+                                ('endpoint', 'method', 'status'))
+        self.response_size = Histogram('http_response_size_bytes', 'Response body size.',
+                                       SIZE_BUCKETS, ('endpoint',))
+        self.query_count = Histogram('db_queries_per_request', 'SQL statements executed per request.',
+                                     COUNT_BUCKETS, ('endpoint',))
+        self.query_duration = Histogram('db_query_duration_seconds_per_request', 'Total SQL time per request.',
+                                        LATENCY_BUCKETS, ('endpoint',))
+        self.render_duration = Histogram('template_render_duration_seconds', 'Template render time.',
+                                         LATENCY_BUCKETS, ('template',))
+        self.all = [self.request_duration, self.requests, self.response_size,
+                    self.query_count, self.query_duration, self.render_duration]
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.slow_threshold = app.config.get('SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        before_render_template.connect(self.start_render, app)
+        template_rendered.connect(self.finish_render, app)
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = []
+        g.metrics_query_count = 0
+        g.metrics_query_time = 0.0
+
+    def finish_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        self.request_duration.observe(elapsed, endpoint, request.method)
+        self.requests.inc(endpoint, request.method, response.status_code)
+        if not response.is_streamed:
+            self.response_size.observe(response.calculate_content_length() or 0, endpoint)
+        self.query_count.observe(g.metrics_query_count, endpoint)
+        self.query_duration.observe(g.metrics_query_time, endpoint)
+        if elapsed >= self.slow_threshold:
+            queries = '\n'.join(f'  {duration * 1000:.2f} ms  {statement}' for statement, duration in g.metrics_queries)
+            self.app.logger.warning(
+                f"Slow request: {request.method} {request.full_path.rstrip('?')} took {elapsed * 1000:.1f} ms "
+                f"({g.metrics_query_count} queries, {g.metrics_query_time * 1000:.1f} ms in SQL)\n{queries}"
+            )
+        return response
+
+    def start_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('metrics_render_start', []).append(time.perf_counter())
+
+    def finish_render(self, sender, template, context, **extra):
+        if has_request_context() and g.get('metrics_render_start'):
+            self.render_duration.observe(time.perf_counter() - g.metrics_render_start.pop(), template.name or 'string')
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_query_count += 1
+            g.metrics_query_time += duration
+            if len(g.metrics_queries) < MAX_LOGGED_QUERIES:
+                g.metrics_queries.append((' '.join(statement.split()), duration))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.all) + '\n'
+
+    def response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
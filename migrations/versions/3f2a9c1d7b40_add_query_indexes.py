@@ -0,0 +1,48 @@
+"""add indexes for the listing, search and relationship queries
+
+Revision ID: 3f2a9c1d7b40
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7b40'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns). Databases created by db.create_all() after
+# these indexes were declared on the models already have them, so existing
+# ones are skipped.
+INDEXES = [
+    ('ix_projects_title_id', 'projects', ['title', 'id']),
+    ('ix_projects_date_created_id', 'projects', ['date_created', 'id']),
+    ('ix_projects_last_updated_id', 'projects', ['last_updated', 'id']),
+    ('ix_projects_deadline_id', 'projects', ['deadline', 'id']),
+    ('ix_projects_owner', 'projects', ['owner']),
+    ('ix_milestones_project_id', 'milestones', ['project_id']),
+    ('ix_project_users_user_id', 'project_users', ['user_id']),
+]
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns, unique=False)
+    # Refresh the planner statistics so the new indexes are actually chosen
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
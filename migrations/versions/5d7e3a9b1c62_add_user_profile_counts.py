@@ -0,0 +1,75 @@
+"""add stored profile counts to users and joined_at to project_users
+
+Revision ID: 5d7e3a9b1c62
+Revises: 8c41e0b2d9a7
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7e3a9b1c62'
+down_revision = '8c41e0b2d9a7'
+branch_labels = None
+depends_on = None
+
+# Existing memberships get their project's creation date
+BACKFILL_JOINED = """
+UPDATE project_users SET joined_at = coalesce(
+    (SELECT p.date_created FROM projects p WHERE p.id = project_users.project_id), :now)
+"""
+
+# Same computation as profiles.refresh_user_counts(), inlined so the migration
+# does not depend on application code
+BACKFILL_COUNTS = """
+UPDATE users SET
+    projects_owned = (SELECT count(*) FROM projects p WHERE p.owner = users.username),
+    projects_joined = (SELECT count(*) FROM project_users pu JOIN projects p ON p.id = pu.project_id
+                       WHERE pu.user_id = users.id AND p.owner != users.username),
+    milestones_completed = (SELECT coalesce(sum(p.milestone_completed), 0) FROM projects p
+                            WHERE p.owner = users.username
+                            OR p.id IN (SELECT pu.project_id FROM project_users pu WHERE pu.user_id = users.id))
+"""
+
+
+def column_names(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def index_names(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    existing = column_names('users')
+    with op.batch_alter_table('users') as batch_op:
+        for name in ('projects_owned', 'projects_joined', 'milestones_completed'):
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+
+    if 'joined_at' not in column_names('project_users'):
+        op.add_column('project_users', sa.Column('joined_at', sa.DateTime(), nullable=True))
+        op.get_bind().execute(sa.text(BACKFILL_JOINED), {'now': datetime.utcnow()})
+        with op.batch_alter_table('project_users') as batch_op:
+            batch_op.alter_column('joined_at', existing_type=sa.DateTime(), nullable=False)
+
+    indexes = index_names('project_users')
+    if 'ix_project_users_user_joined' not in indexes:
+        op.create_index('ix_project_users_user_joined', 'project_users', ['user_id', 'joined_at', 'project_id'], unique=False)
+    if 'ix_project_users_user_id' in indexes:  # Covered by the new index's prefix
+        op.drop_index('ix_project_users_user_id', table_name='project_users')
+
+    op.execute(BACKFILL_COUNTS)
+
+
+def downgrade():
+    op.create_index('ix_project_users_user_id', 'project_users', ['user_id'], unique=False)
+    op.drop_index('ix_project_users_user_joined', table_name='project_users')
+    with op.batch_alter_table('project_users') as batch_op:
+        batch_op.drop_column('joined_at')
+    with op.batch_alter_table('users') as batch_op:
+        for name in ('milestones_completed', 'projects_joined', 'projects_owned'):
+            batch_op.drop_column(name)
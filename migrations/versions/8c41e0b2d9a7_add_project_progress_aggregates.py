@@ -0,0 +1,68 @@
+"""add stored milestone aggregates to projects
+
+Revision ID: 8c41e0b2d9a7
+Revises: 3f2a9c1d7b40
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e0b2d9a7'
+down_revision = '3f2a9c1d7b40'
+branch_labels = None
+depends_on = None
+
+# Same computation as progress.refresh_progress(), inlined so the migration
+# does not depend on application code
+BACKFILL = """
+UPDATE projects SET
+    milestone_total = (SELECT count(*) FROM milestones m WHERE m.project_id = projects.id),
+    milestone_completed = (SELECT count(*) FROM milestones m WHERE m.project_id = projects.id AND m.completed = 1),
+    milestone_overdue = (SELECT count(*) FROM milestones m WHERE m.project_id = projects.id
+                         AND coalesce(m.completed, 0) = 0 AND m.deadline < :now),
+    next_deadline = (SELECT min(m.deadline) FROM milestones m WHERE m.project_id = projects.id
+                     AND coalesce(m.completed, 0) = 0 AND m.deadline >= :now),
+    progress = coalesce(
+        CAST((SELECT count(*) FROM milestones m WHERE m.project_id = projects.id AND m.completed = 1) AS FLOAT)
+        / nullif((SELECT count(*) FROM milestones m WHERE m.project_id = projects.id), 0), 0.0)
+"""
+
+
+def column_names():
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns('projects')}
+
+
+def upgrade():
+    existing = column_names()
+    with op.batch_alter_table('projects') as batch_op:
+        for name in ('milestone_total', 'milestone_completed', 'milestone_overdue'):
+            if name not in existing:
+                batch_op.add_column(sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+        if 'next_deadline' not in existing:
+            batch_op.add_column(sa.Column('next_deadline', sa.DateTime(), nullable=True))
+        if 'progress' not in existing:
+            batch_op.add_column(sa.Column('progress', sa.Float(), nullable=False, server_default='0'))
+
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('projects')}
+    if 'ix_projects_next_deadline_id' not in indexes:
+        op.create_index('ix_projects_next_deadline_id', 'projects', ['next_deadline', 'id'], unique=False)
+    if 'ix_projects_progress_id' not in indexes:
+        op.create_index('ix_projects_progress_id', 'projects', ['progress', 'id'], unique=False)
+
+    op.get_bind().execute(sa.text(BACKFILL), {'now': datetime.utcnow()})
+
+
+def downgrade():
+    op.drop_index('ix_projects_progress_id', table_name='projects')
+    op.drop_index('ix_projects_next_deadline_id', table_name='projects')
+    with op.batch_alter_table('projects') as batch_op:
+        for name in ('progress', 'next_deadline', 'milestone_overdue', 'milestone_completed', 'milestone_total'):
+            batch_op.drop_column(name)
+    # SQLite batch mode rebuilt the table: its rowids may have changed and the
+    # search triggers were dropped (`flask init-db` recreates them)
+    if 'projects_fts' in sa.inspect(op.get_bind()).get_table_names():
+        op.execute("INSERT INTO projects_fts(projects_fts) VALUES ('rebuild')")
@@ -0,0 +1,49 @@
+"""add the changes table behind the /changes feed
+
+Revision ID: 9e2b6c4d8f10
+Revises: 5d7e3a9b1c62
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e2b6c4d8f10'
+down_revision = '5d7e3a9b1c62'
+branch_labels = None
+depends_on = None
+
+# Created with the backfill by `flask init-db` (changes.create_log), like the
+# search triggers; named here so that a downgrade can remove them
+TRIGGERS = (
+    'changes_projects_ai', 'changes_projects_au', 'changes_projects_ad',
+    'changes_milestones_ai', 'changes_milestones_au', 'changes_milestones_ad',
+    'changes_members_ai', 'changes_members_ad',
+)
+
+
+def upgrade():
+    if 'changes' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'changes',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(length=16), nullable=False),
+        sa.Column('entity_id', sa.String(length=64), nullable=False),
+        sa.Column('project_id', sa.String(length=64), nullable=False),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq'),
+        sa.UniqueConstraint('entity', 'entity_id', name='uq_changes_entity'),
+        sqlite_autoincrement=True,
+    )
+    op.create_index('ix_changes_entity_seq', 'changes', ['entity', 'seq'], unique=False)
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_index('ix_changes_entity_seq', table_name='changes')
+    op.drop_table('changes')
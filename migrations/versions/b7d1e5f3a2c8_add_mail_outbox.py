@@ -0,0 +1,46 @@
+"""add the mail_outbox table behind the queued contact mail
+
+Revision ID: b7d1e5f3a2c8
+Revises: 9e2b6c4d8f10
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d1e5f3a2c8'
+down_revision = '9e2b6c4d8f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # `flask init-db` creates it as well on databases built after the outbox
+    if 'mail_outbox' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'mail_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('sender', sa.String(length=255), nullable=False),
+        sa.Column('recipients', sa.Text(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('html', sa.Text(), nullable=True),
+        sa.Column('reply_to', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('claimed_by', sa.String(length=32), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_mail_outbox_status_next_attempt', 'mail_outbox', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_mail_outbox_status_next_attempt', table_name='mail_outbox')
+    op.drop_table('mail_outbox')
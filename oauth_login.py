@@ -0,0 +1,166 @@
+import secrets
+import threading
+import time
+from urllib.parse import urlencode
+from flask import session, request, redirect
+
+# OpenID Connect login against Google (or any provider with a discovery document).
+#
+# The callback used to open two fresh HTTPS connections per login: the token
+# exchange and a separate userinfo call. Here a single requests.Session with a
+# connection pool is shared by all logins in the worker, the discovery document
+# and the provider's signing keys are cached (keys are refetched once when an
+# unknown key id shows up, which is how providers rotate them), and the email
+# is read from the ID token returned by the token exchange, verified locally.
+# A login therefore costs one round trip over a kept-alive connection.
+#
+# OAUTH_DISCOVERY_URL can point at stub_idp.py to run the whole flow locally.
+# requests and authlib are imported by the first login (or by preload() in a
+# preforking server), not when the app is created.
+
+DEFAULT_DISCOVERY_URL = 'https://accounts.google.com/.well-known/openid-configuration'
+# Google documents both forms of its `iss` claim as valid
+ISSUER_ALIASES = {'https://accounts.google.com': ['accounts.google.com']}
+
+
+class OAuthError(Exception):
+    pass
+
+
+class OIDCClient:
+    def __init__(self, app=None):
+        self.lock = threading.RLock()  # Held while fetching, which may nest (keys -> metadata -> session)
+        self.metadata_cache = None
+        self.metadata_expires = 0
+        self.keys = None
+        self.session = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('OAUTH_DISCOVERY_URL', DEFAULT_DISCOVERY_URL)
+        app.config.setdefault('OAUTH_SCOPE', 'openid email')
+        app.config.setdefault('OAUTH_TIMEOUT', 10)
+        app.config.setdefault('OAUTH_POOL_SIZE', 10)
+        app.config.setdefault('OAUTH_METADATA_TTL', 3600)
+        self.client_id = app.config.get('OAUTH_CLIENT_ID')
+        self.client_secret = app.config.get('OAUTH_CLIENT_SECRET')
+        self.discovery_url = app.config['OAUTH_DISCOVERY_URL']
+        self.scope = app.config['OAUTH_SCOPE']
+        self.timeout = app.config['OAUTH_TIMEOUT']
+        self.metadata_ttl = app.config['OAUTH_METADATA_TTL']
+        self.pool_size = app.config['OAUTH_POOL_SIZE']
+        self.metadata_cache = None  # May have come from another app's provider
+        self.keys = None
+        app.extensions['oidc_client'] = self
+
+    def preload(self):
+        # Imports what the first login would, e.g. before a preforking server forks
+        import requests  # noqa: F401
+        import authlib.jose  # noqa: F401
+
+    @property
+    def http(self):
+        if self.session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            with self.lock:
+                if self.session is None:
+                    http = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=1)
+                    http.mount('https://', adapter)
+                    http.mount('http://', adapter)
+                    self.session = http
+        return self.session
+
+    def fetch(self, method, url, **kwargs):
+        import requests
+        try:
+            response = self.http.request(method, url, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise OAuthError(f'{method} {url} failed: {e}') from e
+
+    def metadata(self):
+        if self.metadata_cache is None or time.monotonic() >= self.metadata_expires:
+            with self.lock:
+                if self.metadata_cache is None or time.monotonic() >= self.metadata_expires:
+                    self.metadata_cache = self.fetch('GET', self.discovery_url)
+                    self.metadata_expires = time.monotonic() + self.metadata_ttl
+        return self.metadata_cache
+
+    def signing_keys(self, refresh=False):
+        from authlib.jose import JsonWebKey
+        if self.keys is None or refresh:
+            with self.lock:
+                self.keys = JsonWebKey.import_key_set(self.fetch('GET', self.metadata()['jwks_uri']))
+        return self.keys
+
+    def authorize_redirect(self, redirect_uri):
+        if not self.client_id or not self.client_secret:
+            raise OAuthError('Login is not configured (set CLIENT_ID and CLIENT_SECRET)')
+        state = secrets.token_urlsafe(16)
+        nonce = secrets.token_urlsafe(16)
+        session['oauth_state'] = {'state': state, 'nonce': nonce, 'redirect_uri': redirect_uri}
+        params = {
+            'response_type': 'code',
+            'client_id': self.client_id,
+            'redirect_uri': redirect_uri,
+            'scope': self.scope,
+            'state': state,
+            'nonce': nonce,
+        }
+        return redirect(self.metadata()['authorization_endpoint'] + '?' + urlencode(params))
+
+    def authorize(self):
+        # Completes the login on the redirect back from the provider and returns
+        # (token, claims). Raises OAuthError when the user denied access or the
+        # response does not check out.
+        pending = session.pop('oauth_state', None)
+        if 'error' in request.args:
+            raise OAuthError(request.args.get('error_description') or request.args['error'])
+        if not pending or request.args.get('state') != pending['state']:
+            raise OAuthError('State mismatch')
+        if 'code' not in request.args:
+            raise OAuthError('Missing authorization code')
+
+        metadata = self.metadata()
+        token = self.fetch('POST', metadata['token_endpoint'], data={
+            'grant_type': 'authorization_code',
+            'code': request.args['code'],
+            'redirect_uri': pending['redirect_uri'],
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
+        if 'id_token' not in token:
+            raise OAuthError('Token response has no ID token')
+        claims = self.decode_id_token(token['id_token'], pending['nonce'])
+        if 'email' not in claims:
+            # Providers that leave the email out of the ID token still have userinfo
+            claims = dict(claims)
+            claims.update(self.fetch('GET', metadata['userinfo_endpoint'],
+                                     headers={'Authorization': f"Bearer {token['access_token']}"}))
+        return token, claims
+
+    def decode_id_token(self, id_token, nonce):
+        from authlib.jose import jwt
+        from authlib.jose.errors import JoseError
+        issuer = self.metadata()['issuer']
+        options = {
+            'iss': {'essential': True, 'values': [issuer, *ISSUER_ALIASES.get(issuer, [])]},
+            'aud': {'essential': True, 'value': self.client_id},
+            'nonce': {'essential': True, 'value': nonce},
+        }
+        try:
+            try:
+                claims = jwt.decode(id_token, self.signing_keys(), claims_options=options)
+            except ValueError:  # Unknown key id: the provider rotated its keys
+                claims = jwt.decode(id_token, self.signing_keys(refresh=True), claims_options=options)
+            claims.validate(leeway=60)
+        except (JoseError, ValueError, KeyError) as e:  # KeyError: alg does not fit the key
+            raise OAuthError(f'Invalid ID token: {e}') from e
+        # The email picks (or creates) the User, so the provider must vouch for it
+        if claims.get('email_verified') not in (True, 'true'):
+            raise OAuthError('Email address not verified')
+        return claims
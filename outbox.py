@@ -0,0 +1,160 @@
+import json
+import os
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+from flask_mail import Message
+from classes import db, OutboxMessage
+
+# Persistent outbound mail queue.
+#
+# Routes enqueue a flask_mail Message into the mail_outbox table and return
+# straight away. A background thread (one per worker process) drains due
+# messages in batches over a single SMTP connection. Rows are claimed with a
+# lease before sending so that several workers can share the table without
+# sending anything twice, and a crashed sender's lease simply expires.
+# Failures are retried with exponential backoff until MAIL_OUTBOX_MAX_ATTEMPTS.
+# The sender starts with the first request a worker process handles, so that
+# messages left pending or in backoff by a restarted worker are picked up
+# without waiting for a new one to be enqueued.
+
+
+class MailOutbox:
+    def __init__(self, app=None, mail=None):
+        self.app = None
+        self.mail = None
+        self.thread = None
+        self.started_pid = None
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, mail)
+
+    def init_app(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.batch_size = app.config.get('MAIL_OUTBOX_BATCH_SIZE', 50)
+        self.poll_interval = app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 30)
+        self.max_attempts = app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8)
+        self.backoff = app.config.get('MAIL_OUTBOX_BACKOFF', 30)
+        self.backoff_max = app.config.get('MAIL_OUTBOX_BACKOFF_MAX', 3600)
+        self.lease = app.config.get('MAIL_OUTBOX_LEASE', 300)
+        self.background = app.config.get('MAIL_OUTBOX_BACKGROUND', True)
+        if self.background:
+            app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        # Once per process, including workers forked from a preloaded app
+        if self.started_pid != os.getpid():
+            self.started_pid = os.getpid()
+            self.wake()
+
+    def enqueue(self, message, commit=True):
+        entry = OutboxMessage(
+            subject=message.subject,
+            sender=message.sender if isinstance(message.sender, str) else json.dumps(message.sender),
+            recipients=json.dumps(message.recipients),
+            body=message.body,
+            html=message.html,
+            reply_to=message.reply_to,
+            next_attempt_at=datetime.utcnow(),
+        )
+        db.session.add(entry)
+        if commit:
+            db.session.commit()
+            self.wake()
+        return entry
+
+    def wake(self):
+        if not self.background:
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='mail-outbox', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.send_batch() == self.batch_size:
+                        pass
+            except Exception as e:
+                self.app.logger.exception(f"Mail outbox sender failed: {e}")
+
+    def claim_batch(self):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        due = db.session.query(OutboxMessage.id).filter(
+            OutboxMessage.status == 'pending',
+            OutboxMessage.next_attempt_at <= now
+        ).order_by(OutboxMessage.next_attempt_at).limit(self.batch_size).subquery()
+        OutboxMessage.query.filter(
+            OutboxMessage.id.in_(db.select(due.c.id)),
+            OutboxMessage.status == 'pending',
+            OutboxMessage.next_attempt_at <= now
+        ).update({
+            OutboxMessage.next_attempt_at: now + timedelta(seconds=self.lease),
+            OutboxMessage.claimed_by: token,
+        }, synchronize_session=False)
+        db.session.commit()
+        return OutboxMessage.query.filter_by(status='pending', claimed_by=token).order_by(OutboxMessage.id).all()
+
+    def to_message(self, entry):
+        sender = entry.sender
+        if sender.startswith('['):
+            sender = tuple(json.loads(sender))
+        return Message(subject=entry.subject, sender=sender, recipients=json.loads(entry.recipients),
+                       body=entry.body, html=entry.html, reply_to=entry.reply_to)
+
+    def mark_sent(self, entry):
+        entry.status = 'sent'
+        entry.sent_at = datetime.utcnow()
+        entry.attempts += 1
+        entry.last_error = None
+
+    def mark_failed(self, entry, error):
+        entry.attempts += 1
+        entry.last_error = str(error)[:1000]
+        if entry.attempts >= self.max_attempts:
+            entry.status = 'failed'
+        else:
+            delay = min(self.backoff * 2 ** (entry.attempts - 1), self.backoff_max)
+            entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    # Sends one batch of due messages and returns how many were claimed
+    def send_batch(self):
+        batch = self.claim_batch()
+        if not batch:
+            return 0
+        pending = list(batch)
+        try:
+            with self.mail.connect() as conn:
+                while pending:
+                    entry = pending[0]
+                    try:
+                        conn.send(self.to_message(entry))
+                        self.mark_sent(entry)
+                    except smtplib.SMTPServerDisconnected:
+                        raise  # The connection is gone; handled below for the rest
+                    except (smtplib.SMTPException, AssertionError, ValueError) as e:
+                        self.mark_failed(entry, e)  # This message was rejected; other OSErrors propagate
+                    pending.pop(0)
+                    db.session.commit()
+        except (smtplib.SMTPException, OSError) as e:
+            for entry in pending:
+                self.mark_failed(entry, e)
+        db.session.commit()
+        return len(batch)
+
+    def drain(self):
+        total = 0
+        while True:
+            sent = self.send_batch()
+            total += sent
+            if sent < self.batch_size:
+                return total
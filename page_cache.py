@@ -0,0 +1,66 @@
+import os
+import threading
+from collections import OrderedDict
+from flask import render_template, session, request
+from flask_wtf.csrf import generate_csrf
+
+# Render cache for the mostly-static content pages (home, about, faq, contact).
+#
+# A page is keyed on its endpoint and the only session state base.html reads:
+# the logged-in username. Pages are never cached while flashed messages are
+# pending, since rendering them consumes the flashes. Each entry remembers the
+# mtimes of its template files and data files, so editing about.txt or a
+# template is picked up on the next request without a restart.
+#
+# Forms keep working because csrf_token() is rendered as a placeholder and
+# swapped for the visitor's own token when the cached page is served.
+
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+
+
+class PageCache:
+    def __init__(self, app=None):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_size = 1024
+        self.template_dir = 'templates'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('PAGE_CACHE_SIZE', 1024)
+        self.template_dir = os.path.join(app.root_path, app.template_folder)
+        self.entries.clear()
+
+    def mtimes(self, paths):
+        try:
+            return tuple(os.stat(path).st_mtime_ns for path in paths)
+        except OSError:
+            return None
+
+    def render(self, template, files=(), context=None):
+        # `context` is a callable so that data files are only read on a miss
+        if '_flashes' in session:
+            return render_template(template, **(context() if context else {}))
+
+        paths = [os.path.join(self.template_dir, name) for name in (template, 'base.html')] + list(files)
+        key = (request.endpoint, session.get('username'))
+        stamp = self.mtimes(paths)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                body = entry[1]
+            else:
+                body = None
+        if body is None:
+            body = render_template(template, csrf_token=lambda: CSRF_PLACEHOLDER, **(context() if context else {}))
+            if stamp is not None:
+                with self.lock:
+                    self.entries[key] = (stamp, body)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_size:
+                        self.entries.popitem(last=False)
+        if CSRF_PLACEHOLDER in body:
+            body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+        return body
@@ -0,0 +1,122 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, tuple_
+from classes import Project
+
+# Keyset ("seek") pagination for project listings. Each sort order is a column
+# plus a direction; ties are broken on Project.id so the ordering is total and
+# every page is a single index range scan, however deep the client scrolls.
+# Each order is backed by a composite (column, id) index declared on Project.
+SORT_ORDERS = {
+    'title': (Project.title, False),
+    'date_created': (Project.date_created, True),
+    'last_updated': (Project.last_updated, True),
+    'deadline': (Project.deadline, False),
+    'closing_soon': (Project.next_deadline, False),
+    'most_complete': (Project.progress, True),
+}
+DEFAULT_SORT = 'title'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+# Opaque URL-safe token for a list of JSON values (datetimes allowed)
+def pack_cursor(values):
+    raw = json.dumps([encode_value(v) for v in values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def unpack_cursor(token, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError as e:
+        raise InvalidCursor(token) from e
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursor(token)
+    try:
+        return [decode_value(v) for v in values]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(token) from e
+
+
+def encode_cursor(sort, project):
+    column, _ = SORT_ORDERS[sort]
+    return pack_cursor([sort, getattr(project, column.key), project.id])
+
+
+# Whether a decoded cursor value can be compared with the sort column
+def matches_column(column, value):
+    if value is None:
+        return True
+    expected = column.type.python_type
+    if expected is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, expected)
+
+
+def decode_cursor(token):
+    sort, value, last_id = unpack_cursor(token, 3)
+    if sort not in SORT_ORDERS or not isinstance(last_id, str) or not matches_column(SORT_ORDERS[sort][0], value):
+        raise InvalidCursor(token)
+    return sort, value, last_id
+
+
+def order_clause(sort):
+    column, descending = SORT_ORDERS[sort]
+    if descending:
+        return [column.desc().nulls_last(), Project.id.desc()]
+    return [column.asc().nulls_last(), Project.id.asc()]
+
+
+def seek_clause(sort, value, last_id):
+    column, descending = SORT_ORDERS[sort]
+    # NULLs sort last, so once the cursor is inside the NULL tail only ids move
+    if value is None:
+        id_cmp = Project.id < last_id if descending else Project.id > last_id
+        return and_(column.is_(None), id_cmp)
+    if descending:
+        after = tuple_(column, Project.id) < tuple_(value, last_id)
+    else:
+        after = tuple_(column, Project.id) > tuple_(value, last_id)
+    if column.nullable:
+        return or_(after, column.is_(None))
+    return after
+
+
+# Attribute name of the column a page is ordered by, so callers using
+# load_only() can keep it loaded for the next cursor
+def sort_key(sort=DEFAULT_SORT, after=None):
+    if after:
+        sort = decode_cursor(after)[0]
+    elif sort not in SORT_ORDERS:
+        raise InvalidCursor(sort)
+    return SORT_ORDERS[sort][0].key
+
+
+# Returns (items, next_cursor); next_cursor is None on the last page
+def keyset_page(query, sort=DEFAULT_SORT, after=None, per_page=10):
+    if after:
+        sort, value, last_id = decode_cursor(after)
+        query = query.filter(seek_clause(sort, value, last_id))
+    elif sort not in SORT_ORDERS:
+        raise InvalidCursor(sort)
+    # Fetch one extra row to learn whether another page exists without a COUNT
+    rows = query.order_by(*order_clause(sort)).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = encode_cursor(sort, items[-1]) if len(rows) > per_page else None
+    return items, next_cursor
@@ -0,0 +1,66 @@
+from datetime import datetime
+from sqlalchemy import select, func, update, or_, tuple_
+from classes import db, User, Project, project_users
+from pagination import pack_cursor, unpack_cursor, InvalidCursor
+from projections import load_columns, PRESETS
+
+# User profiles: stored per-user counts and the paginated project list.
+#
+# projects_owned, projects_joined and milestones_completed live on the users
+# row and are refreshed with one correlated UPDATE for the users a write
+# touched (the project's members before and after the change), in the same
+# transaction and after progress.refresh_progress(), whose stored
+# milestone_completed they sum. The project list walks
+# ix_project_users_user_joined newest first with a keyset cursor, loading only
+# the columns of the requested fields for one page, so a profile costs the
+# same however many projects the user has.
+
+PROFILE_PAGE_SIZE = 20
+
+
+def refresh_statement():
+    of_user = project_users.c.user_id == User.id
+    member_of = select(project_users.c.project_id).where(of_user).correlate(User)
+    owned = select(func.count(Project.id)).where(Project.owner == User.username).scalar_subquery()
+    joined = select(func.count()).select_from(project_users).join(
+        Project, Project.id == project_users.c.project_id
+    ).where(of_user, Project.owner != User.username).scalar_subquery()
+    milestones = select(func.coalesce(func.sum(Project.milestone_completed), 0)).where(
+        or_(Project.owner == User.username, Project.id.in_(member_of))
+    ).scalar_subquery()
+    return update(User).values(projects_owned=owned, projects_joined=joined, milestones_completed=milestones)
+
+
+# Recompute the counts of the given users (all users when None)
+def refresh_user_counts(user_ids=None):
+    stmt = refresh_statement()
+    if user_ids is not None:
+        user_ids = set(user_ids)
+        if not user_ids:
+            return 0
+        stmt = stmt.where(User.id.in_(user_ids))
+    return db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+
+
+def member_ids(project_id):
+    return db.session.execute(
+        select(project_users.c.user_id).where(project_users.c.project_id == project_id)
+    ).scalars().all()
+
+
+# Returns (projects, next_cursor) for one page of the user's projects, newest
+# membership first; next_cursor is None on the last page
+def user_projects_page(user, after=None, per_page=PROFILE_PAGE_SIZE, fields=PRESETS['profile']):
+    key = tuple_(project_users.c.joined_at, project_users.c.project_id)
+    query = db.session.query(Project, project_users.c.joined_at).join(
+        project_users, project_users.c.project_id == Project.id
+    ).filter(project_users.c.user_id == user.id).options(load_columns(fields))
+    if after:
+        joined_at, last_id = unpack_cursor(after, 2)
+        if not isinstance(joined_at, datetime) or not isinstance(last_id, str):
+            raise InvalidCursor(after)
+        query = query.filter(key < tuple_(joined_at, last_id))
+    rows = query.order_by(project_users.c.joined_at.desc(), project_users.c.project_id.desc()).limit(per_page + 1).all()
+    page = rows[:per_page]
+    next_cursor = pack_cursor([page[-1][1], page[-1][0].id]) if len(rows) > per_page else None
+    return [project for project, _ in page], next_cursor
@@ -0,0 +1,86 @@
+from datetime import datetime
+from sqlalchemy import select, func, update, cast, Float, false
+from flask import current_app
+from classes import db, Project, Milestone
+from throttle import Throttle
+
+# Stored per-project milestone aggregates (total, completed, overdue, next
+# upcoming deadline and the completed fraction), so listings can show and sort
+# by progress without loading milestones.
+#
+# Writes refresh only the projects they touched with one correlated UPDATE.
+# Time alone also changes the numbers: once a project's next_deadline passes,
+# a milestone has become overdue. sweep() refreshes exactly those projects
+# (an index range on next_deadline) and is run at most once per
+# DEADLINE_SWEEP_INTERVAL seconds per worker, or from `flask sweep-deadlines`.
+
+
+def not_completed():
+    return func.coalesce(Milestone.completed, false()) == false()
+
+
+def refresh_statement(now):
+    of_project = Milestone.project_id == Project.id
+    total = select(func.count(Milestone.id)).where(of_project).scalar_subquery()
+    completed = select(func.count(Milestone.id)).where(of_project, Milestone.completed.is_(True)).scalar_subquery()
+    overdue = select(func.count(Milestone.id)).where(
+        of_project, not_completed(), Milestone.deadline < now
+    ).scalar_subquery()
+    next_deadline = select(func.min(Milestone.deadline)).where(
+        of_project, not_completed(), Milestone.deadline >= now
+    ).scalar_subquery()
+    return update(Project).values(
+        milestone_total=total,
+        milestone_completed=completed,
+        milestone_overdue=overdue,
+        next_deadline=next_deadline,
+        progress=func.coalesce(cast(completed, Float) / func.nullif(total, 0), 0.0),
+        last_updated=Project.last_updated,  # Aggregates alone do not count as an edit
+    )
+
+
+# Recompute the aggregates of the given projects (all projects when None)
+def refresh_progress(project_ids=None):
+    stmt = refresh_statement(datetime.utcnow())
+    if project_ids is not None:
+        project_ids = list(project_ids)
+        if not project_ids:
+            return 0
+        stmt = stmt.where(Project.id.in_(project_ids))
+    return db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+
+
+def sweep():
+    now = datetime.utcnow()
+    stmt = refresh_statement(now).where(Project.next_deadline < now)
+    updated = db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+    db.session.commit()
+    return updated
+
+
+class DeadlineSweeper:
+    def __init__(self, app=None, on_change=None):
+        self.throttle = Throttle()
+        self.on_change = on_change
+        if app is not None:
+            self.init_app(app, on_change)
+
+    def init_app(self, app, on_change=None):
+        self.throttle.interval = app.config.get('DEADLINE_SWEEP_INTERVAL', 60)
+        self.on_change = on_change
+        app.before_request(self.maybe_sweep)
+
+    def maybe_sweep(self):
+        self.throttle(self.run_sweep)
+
+    def run_sweep(self):
+        # Runs inside someone else's request, which must not fail because of it;
+        # the next interval tries again
+        try:
+            updated = sweep()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception(f"Deadline sweep failed: {e}")
+            return
+        if updated and self.on_change:
+            self.on_change()
@@ -0,0 +1,77 @@
+from datetime import datetime
+from classes import db, User, Milestone
+
+# Set-based helpers for the project save paths. Each one issues a fixed number
+# of statements however many collaborators or milestones are submitted: lookups
+# use a single IN query and milestone changes go out as bulk executemany
+# INSERT/UPDATE and one DELETE, all inside the caller's transaction. (ORM
+# unit-of-work inserts would be sent one row at a time on SQLite, which cannot
+# batch INSERT ... RETURNING for autoincrement keys.)
+
+
+def parse_usernames(raw):
+    names = []
+    for username in raw.split(','):
+        username = username.strip()
+        if username and username not in names:
+            names.append(username)
+    return names
+
+
+# Returns (users, invalid_usernames) for the owner plus the comma-separated
+# collaborator names, using one IN query. The owner comes first when present.
+def resolve_collaborators(raw, owner):
+    names = [owner] + [name for name in parse_usernames(raw) if name != owner]
+    found = {user.username: user for user in User.query.filter(User.username.in_(names))}
+    invalid = [name for name in names[1:] if name not in found]
+    return [found[name] for name in names if name in found], invalid
+
+
+def parse_deadline(value):
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+def add_milestones(project, descriptions, deadlines, completed=False):
+    rows = [
+        {'description': desc.strip(), 'project_id': project.id, 'deadline': parse_deadline(dl), 'completed': completed}
+        for desc, dl in zip(descriptions, deadlines) if desc.strip()
+    ]
+    if rows:
+        db.session.flush()  # The project row must exist before its milestones
+        db.session.execute(db.insert(Milestone), rows)
+    return rows
+
+
+# Applies the edit form's milestone rows to `project`: rows with an id update
+# that milestone, rows without one are created, and existing milestones missing
+# from the form are deleted. `completed` holds the form indexes ticked as done.
+# Only rows whose values actually changed are written.
+def sync_milestones(project, ids, descriptions, deadlines, completed):
+    existing = {m_id: (desc, deadline, done) for m_id, desc, deadline, done in db.session.query(
+        Milestone.id, Milestone.description, Milestone.deadline, Milestone.completed
+    ).filter(Milestone.project_id == project.id)}
+    kept = set()
+    updates = []
+    new_rows = []
+    for idx, (m_id, desc, dl) in enumerate(zip(ids, descriptions, deadlines)):
+        values = (desc.strip(), parse_deadline(dl), idx in completed)
+        if m_id:
+            m_id = int(m_id) if m_id.isdigit() else None
+            if m_id not in existing:
+                continue
+            kept.add(m_id)
+            if existing[m_id] != values:
+                updates.append({'id': m_id, 'description': values[0], 'deadline': values[1], 'completed': values[2]})
+        elif values[0]:
+            new_rows.append({'project_id': project.id, 'description': values[0], 'deadline': values[1], 'completed': values[2]})
+
+    removed = [m_id for m_id in existing if m_id not in kept]
+    if updates:
+        db.session.execute(db.update(Milestone), updates)
+    if removed:
+        db.session.execute(db.delete(Milestone).where(Milestone.id.in_(removed)))
+    if new_rows:
+        db.session.execute(db.insert(Milestone), new_rows)
+    # The loaded collection no longer matches the table
+    db.session.expire(project, ['milestones'])
+    return new_rows, updates, removed
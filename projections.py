@@ -0,0 +1,122 @@
+from sqlalchemy import select, func
+from sqlalchemy.orm import load_only
+from classes import db, Project, project_users, isoformat
+from images import image_urls
+
+# Sparse fieldsets for the project listing endpoints.
+#
+#   /load-more-projects?fields=card
+#   /search?q=game&fields=id,title,excerpt,progress
+#
+# `fields` is a comma-separated list of the names below or a preset. Only the
+# columns the requested fields need are loaded (load_only), and collaborators,
+# member counts and milestones are each fetched with one IN query per page
+# only when asked for. Without `fields` the endpoints keep returning the full
+# Project.serialize() document.
+
+EXCERPT_LENGTH = 200
+
+
+def image_names(project):
+    return [image.strip() for image in project.project_images.split(',') if image.strip()] if project.project_images else []
+
+
+def excerpt(text):
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    return text[:EXCERPT_LENGTH].rsplit(' ', 1)[0].rstrip(' ,.;:') + '…'
+
+
+# field -> (columns it reads, value function)
+FIELDS = {
+    'id': (('id',), lambda p: p.id),
+    'title': (('title',), lambda p: p.title),
+    'description': (('description',), lambda p: p.description),
+    'excerpt': (('description',), lambda p: excerpt(p.description)),  # Truncated description
+    'owner': (('owner',), lambda p: p.owner),
+    'images': (('project_images',), lambda p: p.project_images),
+    'image_urls': (('project_images',), lambda p: [image_urls(name) for name in image_names(p)]),
+    'thumb': (('project_images',), lambda p: next((image_urls(name)['thumb'] for name in image_names(p)), None)),
+    'date_created': (('date_created',), lambda p: isoformat(p.date_created)),
+    'category': (('category',), lambda p: p.category),
+    'deadline': (('deadline',), lambda p: isoformat(p.deadline)),
+    'last_updated': (('last_updated',), lambda p: p.last_updated.strftime('%Y-%m-%d %H:%M') if p.last_updated else None),
+    'milestone_total': (('milestone_total',), lambda p: p.milestone_total),
+    'milestone_completed': (('milestone_completed',), lambda p: p.milestone_completed),
+    'milestone_overdue': (('milestone_overdue',), lambda p: p.milestone_overdue),
+    'next_deadline': (('next_deadline',), lambda p: isoformat(p.next_deadline)),
+    'progress': (('progress',), lambda p: p.progress),
+}
+# Fields filled from per-page IN queries instead of columns
+RELATED_FIELDS = {'users', 'user_count', 'milestones'}
+
+PRESETS = {
+    # What a browse card shows
+    'card': ('id', 'title', 'excerpt', 'owner', 'user_count', 'image_urls', 'last_updated',
+             'category', 'progress', 'milestone_total', 'milestone_completed'),
+    # Entries of a user's profile list
+    'profile': ('id', 'title', 'owner', 'category', 'thumb', 'deadline', 'last_updated',
+                'milestone_total', 'milestone_completed', 'next_deadline', 'progress'),
+}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+# Returns the requested field names in order, or None for the full document
+def parse_fields(raw):
+    if not raw:
+        return None
+    if raw in PRESETS:
+        return list(PRESETS[raw])
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if name not in FIELDS and name not in RELATED_FIELDS:
+            raise InvalidFields(name)
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def load_columns(fields, extra=()):
+    # ORM loader option for just the columns `fields` (plus `extra`, e.g. the
+    # keyset sort column) read; the primary key is always loaded
+    names = {'id', *extra}
+    for field in fields:
+        if field in FIELDS:
+            names.update(FIELDS[field][0])
+    return load_only(*[getattr(Project, name) for name in sorted(names)])
+
+
+def serialize_projects(projects, fields):
+    projects = list(projects)
+    ids = [p.id for p in projects]
+    related = {}
+    if ids and ('users' in fields or 'milestones' in fields):
+        usernames, milestones = Project.load_related(ids, users='users' in fields, milestones='milestones' in fields)
+        if usernames is not None:
+            related['users'] = usernames
+        if milestones is not None:
+            related['milestones'] = {pid: [m.serialize() for m in found] for pid, found in milestones.items()}
+    if ids and 'user_count' in fields:
+        counts = {}
+        for start in range(0, len(ids), Project.BATCH_SIZE):
+            counts.update(db.session.execute(
+                select(project_users.c.project_id, func.count())
+                .where(project_users.c.project_id.in_(ids[start:start + Project.BATCH_SIZE]))
+                .group_by(project_users.c.project_id)
+            ).all())
+        related['user_count'] = {pid: counts.get(pid, 0) for pid in ids}
+
+    documents = []
+    for p in projects:
+        document = {}
+        for field in fields:
+            if field in related:
+                document[field] = related[field][p.id]
+            else:
+                document[field] = FIELDS[field][1](p)
+        documents.append(document)
+    return documents
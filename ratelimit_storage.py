@@ -0,0 +1,75 @@
+import sqlite3
+import time
+from limits.storage import Storage
+from sqlite_local import ThreadLocalSQLite
+
+# Host-local rate-limit storage shared by every worker process.
+#
+# Flask-Limiter's default memory storage counts per process, so N preforked
+# workers allow N times the configured limits and forget everything on
+# restart. This backend keeps the fixed-window counters in one small SQLite
+# file in WAL mode: each hit is a single UPSERT ... RETURNING statement in its
+# own short transaction, and with synchronous=OFF there is no fsync on the hot
+# path (a power loss can only lose recent counts). Registering the "sqlite"
+# scheme lets it be selected with RATELIMIT_STORAGE_URI=sqlite:///path.db.
+#
+# Only the fixed-window strategy (Flask-Limiter's default) is supported.
+
+INCR_SQL = """
+INSERT INTO counters (key, count, expiry) VALUES (?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    count = CASE WHEN counters.expiry <= ? THEN excluded.count ELSE counters.count + excluded.count END,
+    expiry = CASE WHEN counters.expiry <= ? THEN excluded.expiry ELSE counters.expiry END
+RETURNING count
+"""
+
+# Expired windows are purged every this many hits
+PURGE_EVERY = 1000
+
+
+class SQLiteStorage(Storage):
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # sqlite:///relative/path.db or sqlite:////absolute/path.db
+        self.db = ThreadLocalSQLite(uri[len('sqlite:///'):], {'journal_mode': 'WAL', 'synchronous': 'OFF'})
+        self.hits = 0
+        conn = self.db.connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expiry REAL NOT NULL) WITHOUT ROWID')
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        conn = self.db.connection()
+        count = conn.execute(INCR_SQL, (key, amount, now + expiry, now, now)).fetchone()[0]
+        if elastic_expiry:
+            conn.execute('UPDATE counters SET expiry = ? WHERE key = ?', (now + expiry, key))
+        self.hits += 1
+        if self.hits % PURGE_EVERY == 0:
+            conn.execute('DELETE FROM counters WHERE expiry <= ?', (now,))
+        return count
+
+    def get(self, key):
+        row = self.db.connection().execute('SELECT count FROM counters WHERE key = ? AND expiry > ?', (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self.db.connection().execute('SELECT expiry FROM counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row and row[0] > time.time() else time.time()
+
+    def check(self):
+        try:
+            self.db.connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self.db.connection().execute('DELETE FROM counters').rowcount
+
+    def clear(self, key):
+        self.db.connection().execute('DELETE FROM counters WHERE key = ?', (key,))
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+from sqlite_local import ThreadLocalSQLite
+
+# Response cache for JSON listing endpoints.
+#
+# Every cached view declares the data it depends on as a named "generation"
+# (e.g. 'projects'). Write routes bump that generation after committing, and
+# because the generation is part of each cache key, everything built from the
+# old data simply stops being addressable; no scan or purge is needed. A
+# request that raced a write can at worst store an entry under the old
+# generation, which is never read again.
+#
+# Entries are held in a bounded in-process LRU. The generation counters and
+# entries are also kept in a small SQLite file (RESPONSE_CACHE_PATH, by default
+# instance/response_cache.db) so that every worker process on the host, and
+# the CLI commands that write projects, share the same invalidations. The
+# in-process backend (RESPONSE_CACHE_PATH='memory') only suits a single
+# process: a write there is invisible to every other worker.
+#
+# Writes that bypass the routes (seeding, migrations, restores) and deploys that
+# change what a view returns can not bump a generation, so the shared file is
+# emptied and every generation bumped whenever an app is created: a restart
+# always starts from a cold cache.
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def generation(self, name):
+        return self.generations.get(name, 0)
+
+    def bump(self, name):
+        with self.lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry):
+        pass
+
+    def reset(self):
+        pass  # Starts empty with each process
+
+
+class SQLiteBackend:
+    def __init__(self, path, max_entries=10000):
+        self.db = ThreadLocalSQLite(path)
+        self.max_entries = max_entries
+        self.writes = 0
+        with self.db.connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, entry BLOB NOT NULL, stored REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_stored ON entries (stored)')
+
+    def generation(self, name):
+        row = self.db.connection().execute('SELECT value FROM generations WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, name):
+        self.db.connection().execute(
+            'INSERT INTO generations (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,)
+        )
+
+    def reset(self):
+        conn = self.db.connection()
+        conn.execute('DELETE FROM entries')
+        conn.execute('UPDATE generations SET value = value + 1')
+
+    def get(self, key):
+        row = self.db.connection().execute('SELECT entry FROM entries WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, entry):
+        conn = self.db.connection()
+        conn.execute('INSERT OR REPLACE INTO entries (key, entry, stored) VALUES (?, ?, ?)',
+                     (key, json.dumps(entry), time.time()))
+        self.writes += 1
+        # Trim the oldest entries now and then rather than on every write
+        if self.writes % 100 == 0:
+            conn.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY stored DESC LIMIT -1 OFFSET ?)',
+                         (self.max_entries,))
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.max_size = 512
+        self.backend = MemoryBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('RESPONSE_CACHE_SIZE', 512)
+        path = app.config.get('RESPONSE_CACHE_PATH') or os.path.join(app.instance_path, 'response_cache.db')
+        if path == 'memory':
+            self.backend = MemoryBackend()
+        else:
+            self.backend = SQLiteBackend(path, app.config.get('RESPONSE_CACHE_DISK_ENTRIES', 10000))
+        self.backend.reset()
+        self.entries.clear()
+
+    def invalidate(self, *names):
+        for name in names:
+            self.backend.bump(name)
+
+    def make_key(self, depends_on):
+        generations = ','.join(f'{name}={self.backend.generation(name)}' for name in depends_on)
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'{request.path}?{args}#{generations}'  # The path carries any URL variables
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        entry = self.backend.get(key)
+        if entry is not None:
+            self.remember(key, entry)
+        return entry
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def store(self, key, response):
+        body = response.get_data()
+        entry = {
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+            'body': body.decode('utf-8'),
+            'mimetype': response.mimetype,
+            'headers': {k: v for k, v in response.headers.items() if k.startswith('X-')},
+        }
+        self.remember(key, entry)
+        self.backend.set(key, entry)
+        return entry
+
+    def respond(self, entry):
+        # Weak comparison: compression.py sends the same ETag as W/"..." on compressed bodies
+        if request.if_none_match.contains_weak(entry['etag']):
+            response = make_response('', 304)
+        else:
+            response = make_response(entry['body'])
+            response.mimetype = entry['mimetype']
+        response.headers.update(entry['headers'])
+        response.set_etag(entry['etag'])
+        # Let browsers keep the body but revalidate it with If-None-Match each time
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def cached(self, *depends_on):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = self.make_key(depends_on)
+                entry = self.lookup(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    entry = self.store(key, response)
+                return self.respond(entry)
+            return wrapper
+        return decorator
@@ -0,0 +1,110 @@
+import re
+from sqlalchemy import text
+from classes import db, Project
+
+# External-content FTS5 index over the projects table. The triggers keep it in
+# sync for every write path (routes, gen_traffic.py, raw SQL), so the routes do
+# not need to know it exists. The index is keyed on the hidden sqlite rowid of
+# `projects`; run `flask rebuild-search-index` after a VACUUM, which may
+# renumber rowids.
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(
+        title, description, owner, category,
+        content='projects', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS projects_fts_ai AFTER INSERT ON projects BEGIN
+        INSERT INTO projects_fts(rowid, title, description, owner, category)
+        VALUES (new.rowid, new.title, new.description, new.owner, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS projects_fts_ad AFTER DELETE ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, title, description, owner, category)
+        VALUES ('delete', old.rowid, old.title, old.description, old.owner, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS projects_fts_au AFTER UPDATE OF title, description, owner, category ON projects BEGIN
+        INSERT INTO projects_fts(projects_fts, rowid, title, description, owner, category)
+        VALUES ('delete', old.rowid, old.title, old.description, old.owner, old.category);
+        INSERT INTO projects_fts(rowid, title, description, owner, category)
+        VALUES (new.rowid, new.title, new.description, new.owner, new.category);
+    END""",
+]
+
+# bm25 column weights: title, description, owner, category
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def create_index():
+    # Part of `flask init-db`; safe to run on an existing database
+    if not fts_available():
+        return
+    with db.engine.begin() as conn:
+        created = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='projects_fts'"
+        )).first() is None
+        for statement in FTS_SCHEMA:
+            conn.execute(text(statement))
+        # Backfill rows that existed before the index did
+        if created:
+            conn.execute(text("INSERT INTO projects_fts(projects_fts) VALUES ('rebuild')"))
+
+
+def rebuild_index():
+    if not fts_available():
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO projects_fts(projects_fts) VALUES ('rebuild')"))
+
+
+def build_match_query(query):
+    # Every word must match; the last one is treated as a prefix so results
+    # narrow as the user types. Quoting each token neutralises FTS5 syntax.
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def clamp_paging(limit, offset):
+    limit = DEFAULT_LIMIT if limit is None else max(1, min(limit, MAX_LIMIT))
+    offset = max(0, offset or 0)
+    return limit, offset
+
+
+# `options` are ORM loader options for the returned projects (e.g. load_only)
+def search_projects(query, limit=DEFAULT_LIMIT, offset=0, options=()):
+    limit, offset = clamp_paging(limit, offset)
+    match = build_match_query(query)
+    if match is None:
+        return Project.query.options(*options).order_by(Project.title, Project.id).limit(limit).offset(offset).all()
+
+    if not fts_available():
+        pattern = f'%{query}%'
+        return Project.query.options(*options).filter(
+            Project.title.ilike(pattern) |
+            Project.description.ilike(pattern) |
+            Project.owner.ilike(pattern) |
+            Project.category.ilike(pattern)
+        ).order_by(Project.title, Project.id).limit(limit).offset(offset).all()
+
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    rows = db.session.execute(text(
+        f"SELECT p.id FROM projects_fts JOIN projects p ON p.rowid = projects_fts.rowid "
+        f"WHERE projects_fts MATCH :match "
+        f"ORDER BY bm25(projects_fts, {weights}) LIMIT :limit OFFSET :offset"
+    ), {'match': match, 'limit': limit, 'offset': offset}).all()
+    ids = [row[0] for row in rows]
+    if not ids:
+        return []
+    by_id = {p.id: p for p in Project.query.options(*options).filter(Project.id.in_(ids))}
+    return [by_id[pid] for pid in ids if pid in by_id]
@@ -0,0 +1,194 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SecureCookieSession
+from sqlite_local import ThreadLocalSQLite
+
+# Server-side sessions with a short opaque cookie.
+#
+# Flask's default session is the whole session dict (including the OAuth
+# token) serialized into a signed cookie, which every request uploads and
+# every request re-verifies. Here the data lives in a small SQLite file shared
+# by the workers on the host, and the cookie only carries
+#
+#   <session id>.<version>
+#
+# The id is 192 random bits, so it does not need a signature. The version is
+# bumped by the database on every write and the cookie reissued, which lets each worker keep
+# an in-process read cache without any cross-process invalidation: a request
+# whose cookie version matches the cached entry is answered from memory, and
+# a newer version (the session was changed by another worker) goes to the
+# database. Cached entries are also revalidated after SESSION_CACHE_TTL
+# seconds, which bounds how long another worker keeps accepting a session
+# that was ended (logout) or replaced (login) elsewhere.
+#
+# Sessions expire SESSION_LIFETIME seconds after they were last written; the
+# expiry is pushed back at most once per half lifetime by a read. Requests
+# that never put anything in the session (static files, anonymous browsing)
+# get no cookie and cost no database access.
+
+PURGE_EVERY = 1000  # Writes between purges of expired sessions
+CREATE_SQL = ('CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+              'data TEXT NOT NULL, expiry REAL NOT NULL) WITHOUT ROWID')
+SAVE_SQL = """
+INSERT INTO sessions (id, version, data, expiry) VALUES (?, 1, ?, ?)
+ON CONFLICT(id) DO UPDATE SET version = sessions.version + 1, data = excluded.data, expiry = excluded.expiry
+RETURNING version
+"""
+
+
+class ServerSession(SecureCookieSession):
+    # SecureCookieSession only for its modified/accessed tracking
+    def __init__(self, initial=None, sid=None, version=0, expiry=0):
+        super().__init__(initial)
+        self.sid = sid
+        self.version = version
+        self.expiry = expiry
+        self.replaced_sid = None
+
+    def regenerate(self):
+        # New id for the same data, e.g. on login so that a planted id is worthless
+        if self.sid is not None:
+            self.replaced_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.db = ThreadLocalSQLite(path)
+        self.writes = 0
+        self.db.connection().execute(CREATE_SQL)
+
+    def get(self, sid):
+        # (version, data, expiry) or None
+        return self.db.connection().execute(
+            'SELECT version, data, expiry FROM sessions WHERE id = ? AND expiry > ?', (sid, time.time())
+        ).fetchone()
+
+    def save(self, sid, data, expiry):
+        # Returns the new version; two concurrent writes never get the same one
+        conn = self.db.connection()
+        version = conn.execute(SAVE_SQL, (sid, data, expiry)).fetchone()[0]
+        self.writes += 1
+        if self.writes % PURGE_EVERY == 0:
+            conn.execute('DELETE FROM sessions WHERE expiry <= ?', (time.time(),))
+        return version
+
+    def touch(self, sid, expiry):
+        self.db.connection().execute('UPDATE sessions SET expiry = ? WHERE id = ?', (expiry, sid))
+
+    def delete(self, sid):
+        self.db.connection().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()  # Same types as Flask's cookie sessions
+
+    def __init__(self, app=None):
+        self.cache = OrderedDict()  # sid -> (version, data, expiry, revalidate_at)
+        self.lock = threading.Lock()
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = app.config.get('SESSION_STORE_PATH') or os.path.join(app.instance_path, 'sessions.db')
+        self.store = SQLiteSessionStore(path)
+        self.lifetime = app.config.get('SESSION_LIFETIME', 14 * 24 * 3600)
+        self.cache_ttl = app.config.get('SESSION_CACHE_TTL', 10)
+        self.cache_size = app.config.get('SESSION_CACHE_SIZE', 10000)
+        self.cache.clear()
+        app.session_interface = self
+
+    def lookup(self, sid, version):
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(sid)
+            if entry is not None and entry[0] == version and entry[3] > now and entry[2] > now:
+                self.cache.move_to_end(sid)
+                return entry[:3]
+        row = self.store.get(sid)
+        if row is None:
+            with self.lock:
+                self.cache.pop(sid, None)
+            return None
+        self.remember(sid, *row)
+        return row
+
+    def remember(self, sid, version, data, expiry):
+        with self.lock:
+            self.cache[sid] = (version, data, expiry, time.time() + self.cache_ttl)
+            self.cache.move_to_end(sid)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def forget(self, sid):
+        with self.lock:
+            self.cache.pop(sid, None)
+        self.store.delete(sid)
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if value:
+            sid, _, version = value.rpartition('.')
+            if sid and version.isdigit():
+                found = self.lookup(sid, int(version))
+                if found is not None:
+                    version, data, expiry = found
+                    return ServerSession(self.serializer.loads(data), sid=sid, version=version, expiry=expiry)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.replaced_sid is not None:
+            self.forget(session.replaced_sid)
+
+        if not session:
+            if session.sid is not None:
+                self.forget(session.sid)
+            if session.sid is not None or session.modified:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        if not session.modified:
+            if session.expiry - now < self.lifetime / 2:
+                session.expiry = now + self.lifetime
+                self.store.touch(session.sid, session.expiry)
+                with self.lock:
+                    self.cache.pop(session.sid, None)
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(24)
+        session.expiry = now + self.lifetime
+        data = self.serializer.dumps(dict(session))
+        session.version = self.store.save(session.sid, data, session.expiry)
+        self.remember(session.sid, session.version, data, session.expiry)
+        response.set_cookie(
+            name, f'{session.sid}.{session.version}',
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            partitioned=self.get_cookie_partitioned(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def create(self, data):
+        # Stores a session outside a request and returns its cookie value
+        # (gen_traffic.py uses this to act as a logged-in user)
+        sid = secrets.token_urlsafe(24)
+        version = self.store.save(sid, self.serializer.dumps(data), time.time() + self.lifetime)
+        return f'{sid}.{version}'
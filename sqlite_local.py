@@ -0,0 +1,31 @@
+import os
+import sqlite3
+import threading
+
+# Per-thread sqlite3 connections to a small host-local SQLite file, shared by
+# the worker processes of one host: the response cache, the rate-limit
+# counters and the session store. Connections are in autocommit mode (each
+# statement is its own short transaction) and are reopened in a process
+# forked after they were made, so a preloaded app never shares one with its
+# workers.
+
+
+class ThreadLocalSQLite:
+    def __init__(self, path, pragmas=None):
+        self.path = path
+        self.pragmas = pragmas or {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.local = threading.local()
+
+    def connection(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            for name, value in self.pragmas.items():
+                conn.execute(f'PRAGMA {name}={value}')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
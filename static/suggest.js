@@ -0,0 +1,42 @@
+// Typeahead for inputs marked with data-suggest="users" or data-suggest="projects".
+// Suggestions come from /suggest and are offered through a <datalist>. For the
+// comma-separated collaborator field only the name being typed is completed.
+document.querySelectorAll('input[data-suggest]').forEach(input => {
+    const kind = input.dataset.suggest;
+    const list = document.createElement('datalist');
+    list.id = `${input.id}-suggestions`;
+    input.after(list);
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+
+    let timer = null;
+    let controller = null;
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            const parts = kind === 'users' ? input.value.split(',') : [input.value];
+            const prefix = parts[parts.length - 1].trim();
+            const head = parts.slice(0, -1).map(part => part.trim()).filter(Boolean);
+            list.innerHTML = '';
+            if (!prefix) return;
+
+            if (controller) controller.abort();
+            controller = new AbortController();
+            try {
+                const response = await fetch(`/suggest?type=${kind}&q=${encodeURIComponent(prefix)}`, { signal: controller.signal });
+                const data = await response.json();
+                const values = kind === 'users'
+                    ? data.users.filter(name => !head.includes(name)).map(name => [...head, name].join(', '))
+                    : data.projects.map(project => project.title);
+                values.forEach(value => {
+                    const option = document.createElement('option');
+                    option.value = value;
+                    list.appendChild(option);
+                });
+            } catch (error) {
+                if (error.name !== 'AbortError') console.error('Error loading suggestions:', error);
+            }
+        }, 100);
+    });
+});
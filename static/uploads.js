@@ -0,0 +1,108 @@
+// Resumable uploads for file inputs marked with data-resumable. On submit the
+// selected images are sent to /uploads in chunks; a chunk that fails is
+// retried from the offset the server reports, and an upload interrupted by a
+// reload continues where it stopped (the upload id is kept in sessionStorage).
+// The form is then submitted with the upload ids instead of the files.
+document.querySelectorAll('input[type=file][data-resumable]').forEach(input => {
+    const form = input.form;
+    const csrfToken = form.querySelector('input[name=csrf_token]').value;
+    const status = document.createElement('div');
+    status.className = 'form-text';
+    input.after(status);
+    const MAX_RETRIES = 5;
+    const completed = new Map();  // Uploads finished by an earlier, failed submit
+
+    async function request(method, url, options = {}) {
+        const response = await fetch(url, {
+            method,
+            credentials: 'same-origin',
+            ...options,
+            headers: { 'X-CSRFToken': csrfToken, ...(options.headers || {}) },
+        });
+        const data = await response.json().catch(() => ({}));
+        return { response, data };
+    }
+
+    async function start(file, key) {
+        const saved = sessionStorage.getItem(key);
+        if (saved) {
+            const { response, data } = await request('GET', `/uploads/${saved}`);
+            if (response.ok) return data;
+        }
+        const { response, data } = await request('POST', '/uploads', {
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ size: file.size }),
+        });
+        if (!response.ok) throw new Error(`${file.name}: ${data.error || response.statusText}`);
+        sessionStorage.setItem(key, data.id);
+        return data;
+    }
+
+    async function upload(file, done, total) {
+        const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        if (completed.has(key)) return completed.get(key);
+        let upload = await start(file, key);
+        const chunkSize = upload.chunk_size || 4 * 1024 * 1024;
+        let offset = upload.offset;
+        let failures = 0;
+        while (!upload.filename) {
+            status.textContent = `Uploading ${file.name}: ${Math.floor(100 * (done + offset) / total)}%`;
+            try {
+                const { response, data } = await request('PATCH', `/uploads/${upload.id}`, {
+                    headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+                    body: file.slice(offset, offset + chunkSize),
+                });
+                if (response.ok || response.status === 409) {
+                    upload = { ...upload, ...data };
+                    offset = data.offset;
+                    failures = 0;
+                    continue;
+                }
+                if (response.status < 500) {
+                    sessionStorage.removeItem(key);
+                    throw new Error(`${file.name}: ${data.error || response.statusText}`);
+                }
+            } catch (error) {
+                if (!(error instanceof TypeError)) throw error;  // Only network errors are retried
+            }
+            if (++failures > MAX_RETRIES) throw new Error(`${file.name}: upload failed, submit again to resume`);
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+            const { response, data } = await request('GET', `/uploads/${upload.id}`).catch(() => ({ response: {} }));
+            if (response.ok) {
+                upload = { ...upload, ...data };
+                offset = data.offset;
+            }
+        }
+        sessionStorage.removeItem(key);
+        completed.set(key, upload.id);
+        return upload.id;
+    }
+
+    form.addEventListener('submit', async event => {
+        const files = Array.from(input.files);
+        if (!files.length || !window.fetch) return;
+        event.preventDefault();
+        const submit = form.querySelector('[type=submit]');
+        submit.disabled = true;
+        const total = files.reduce((sum, file) => sum + file.size, 0);
+        let done = 0;
+        form.querySelectorAll('input[name=upload_ids]').forEach(hidden => hidden.remove());
+        try {
+            for (const file of files) {
+                const hidden = document.createElement('input');
+                hidden.type = 'hidden';
+                hidden.name = 'upload_ids';
+                hidden.value = await upload(file, done, total);
+                form.appendChild(hidden);
+                done += file.size;
+            }
+        } catch (error) {
+            status.textContent = error.message;
+            submit.disabled = false;
+            return;
+        }
+        input.value = '';
+        status.textContent = 'Saving...';
+        form.submit();
+    });
+});
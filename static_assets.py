@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from flask import send_from_directory
+from compression import brotli, accepted_encodings
+
+# Fingerprinted, precompressed static assets.
+#
+# `flask build-static` copies every file under static/ (except uploads and the
+# build output itself) to static/dist/ under a name containing a hash of its
+# content, writes .gz (and .br when the Brotli module is installed) siblings
+# for text assets, and records original -> built name in
+# static/dist/manifest.json. url() references inside CSS are rewritten to the
+# built names first, so a stylesheet's hash changes when an image it uses does.
+#
+# At runtime url_for('static', filename='styles.css') emits the built name, and
+# built files are served with a one-year immutable Cache-Control, picking the
+# precompressed sibling the client accepts. Without a manifest everything
+# falls back to the plain files.
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.txt', '.svg', '.json', '.html', '.map', '.xml'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def fingerprinted(path, digest):
+    stem, ext = posixpath.splitext(path)
+    return f'{stem}.{digest[:HASH_LENGTH]}{ext}'
+
+
+def source_files(static_dir, exclude):
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir)
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.')
+                         and os.path.normpath(os.path.join(rel_root, d)) not in exclude)
+        for name in sorted(files):
+            if not name.startswith('.'):
+                yield posixpath.normpath(posixpath.join(rel_root.replace(os.sep, '/'), name))
+
+
+def rewrite_css(css, css_path, manifest):
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith('/static/'):
+            path = url[len('/static/'):]
+        elif ':' in url or url.startswith(('/', '#')):
+            return match.group(0)
+        else:
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(css_path), url))
+        if path not in manifest:
+            return match.group(0)
+        return f'url({quote}/static/{manifest[path]}{quote})'
+    return CSS_URL_RE.sub(replace, css)
+
+
+def write_precompressed(path, data):
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data) * 0.9:
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data) * 0.9:
+            with open(path + '.br', 'wb') as f:
+                f.write(compressed)
+
+
+def build(static_dir, exclude=()):
+    # Returns the manifest; the previous build is replaced
+    build_dir = os.path.join(static_dir, BUILD_DIR)
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    exclude = {os.path.normpath(path) for path in exclude} | {BUILD_DIR}
+    sources = list(source_files(static_dir, exclude))
+    manifest = {}
+    # Stylesheets last, so the files they reference already have built names
+    for path in sorted(sources, key=lambda p: p.endswith('.css')):
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css(data.decode('utf-8'), path, manifest).encode('utf-8')
+        built = posixpath.join(BUILD_DIR, fingerprinted(path, hashlib.sha256(data).hexdigest()))
+        target = os.path.join(static_dir, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        if posixpath.splitext(path)[1] in PRECOMPRESS_EXTENSIONS:
+            write_precompressed(target, data)
+        manifest[path] = built
+    with open(os.path.join(build_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.built = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.static_dir = app.static_folder
+        self.load()
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions['static'] = self.send_static
+
+    def load(self):
+        # Read once at startup; run `flask build-static` before (re)starting workers
+        try:
+            with open(os.path.join(self.static_dir, BUILD_DIR, MANIFEST), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+        self.built = set(self.manifest.values())
+
+    def fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def send_static(self, filename):
+        if filename not in self.built:
+            return self.app.send_static_file(filename)
+        served = filename
+        encoding = None
+        accepted = accepted_encodings()
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in accepted and os.path.exists(os.path.join(self.static_dir, filename + suffix)):
+                served, encoding = filename + suffix, candidate
+                break
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(self.static_dir, served, mimetype=mimetype, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if posixpath.splitext(filename)[1] in PRECOMPRESS_EXTENSIONS:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,74 @@
+import argparse
+import secrets
+import time
+from urllib.parse import urlencode
+from authlib.jose import JsonWebKey, jwt
+from flask import Flask, request, redirect, jsonify
+
+# Local stand-in for the OpenID Connect provider, for development and tests.
+#
+#   python stub_idp.py --port 5001 --email alice@example.com
+#   OAUTH_DISCOVERY_URL=http://localhost:5001/.well-known/openid-configuration python app.py
+#
+# It serves discovery, signing keys and the token endpoint, and /authorize
+# redirects straight back to the app with a code (no consent screen), so a
+# login can be driven end to end with a test client and no network access.
+# The email can be picked per login with ?login_hint=.
+
+
+def create_idp(email='user@example.com', client_id='stub-client'):
+    idp = Flask(__name__)
+    key = JsonWebKey.generate_key('RSA', 2048, is_private=True, options={'kid': 'stub-key'})
+    codes = {}
+
+    def issuer():
+        return request.host_url.rstrip('/')
+
+    @idp.route('/.well-known/openid-configuration')
+    def discovery():
+        base = issuer()
+        return jsonify({
+            'issuer': base,
+            'authorization_endpoint': base + '/authorize',
+            'token_endpoint': base + '/token',
+            'userinfo_endpoint': base + '/userinfo',
+            'jwks_uri': base + '/jwks',
+        })
+
+    @idp.route('/jwks')
+    def jwks():
+        return jsonify({'keys': [key.as_dict()]})
+
+    @idp.route('/authorize')
+    def authorize():
+        code = secrets.token_urlsafe(16)
+        codes[code] = {'email': request.args.get('login_hint', email), 'nonce': request.args.get('nonce')}
+        query = urlencode({'code': code, 'state': request.args.get('state', '')})
+        return redirect(f"{request.args['redirect_uri']}?{query}")
+
+    @idp.route('/token', methods=['POST'])
+    def token():
+        grant = codes.pop(request.form.get('code'), None)
+        if grant is None or request.form.get('client_id') != client_id:
+            return jsonify({'error': 'invalid_grant'}), 400
+        now = int(time.time())
+        claims = {'iss': issuer(), 'aud': client_id, 'sub': grant['email'], 'email': grant['email'],
+                  'email_verified': True, 'nonce': grant['nonce'], 'iat': now, 'exp': now + 3600}
+        id_token = jwt.encode({'alg': 'RS256', 'kid': 'stub-key'}, claims, key).decode()
+        return jsonify({'access_token': secrets.token_urlsafe(16), 'token_type': 'Bearer',
+                        'expires_in': 3600, 'id_token': id_token})
+
+    @idp.route('/userinfo')
+    def userinfo():
+        return jsonify({'email': email})
+
+    return idp
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in OpenID Connect provider.')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--email', default='user@example.com')
+    parser.add_argument('--client-id', default='stub-client')
+    args = parser.parse_args()
+    create_idp(args.email, args.client_id).run(port=args.port)
@@ -0,0 +1,207 @@
+import threading
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy import select, or_, literal_column
+from classes import db, User, Project
+from throttle import Throttle
+
+# In-memory prefix index behind /suggest (typeahead for project titles and
+# collaborator usernames).
+#
+# Each index is a pair of parallel sorted lists: lowercased keys and the ids
+# they belong to. A lookup is a bisect to the first key >= the prefix and a
+# walk while keys still start with it, so it never touches the database.
+# Titles are indexed from the start of every word ("tool library" finds
+# "Neighbourhood tool library"), with title starts in their own index so that
+# completions of the beginning of a title rank first.
+#
+# The index is built by the first /suggest request, or by warm_up() in app.py
+# before a preforking server forks so that the workers share it. Writes in
+# this worker update it right away (add_project, add_user); writes from other
+# workers, imports and seeding are picked up by a catch-up query at most
+# every SUGGEST_REFRESH_INTERVAL seconds: users by id, projects by rowid (new
+# rows) and last_updated (edits).
+
+KEY_LENGTH = 40  # Keys are truncated; longer prefixes are checked against the full title
+MAX_WORDS = 8  # Word starts indexed per title
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.keys = []
+        self.ids = []
+
+    def load(self, entries):
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = [item_id for _, item_id in entries]
+
+    def add(self, key, item_id):
+        index = bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.ids[index] == item_id:
+                return
+            index += 1
+        self.keys.insert(index, key)
+        self.ids.insert(index, item_id)
+
+    def remove(self, key, item_id):
+        index = bisect_left(self.keys, key)
+        while index < len(self.keys) and self.keys[index] == key:
+            if self.ids[index] == item_id:
+                del self.keys[index]
+                del self.ids[index]
+                return
+            index += 1
+
+    def scan(self, prefix):
+        # Yields (key, id) in key order for every key starting with prefix
+        index = bisect_left(self.keys, prefix[:KEY_LENGTH])
+        keys, ids = self.keys, self.ids
+        while index < len(keys) and keys[index].startswith(prefix[:KEY_LENGTH]):
+            yield keys[index], ids[index]
+            index += 1
+
+
+# Returns (key of the whole title, keys starting at its later words)
+def title_keys(title):
+    lowered = title.lower()
+    keys = []
+    start = 0
+    for word in lowered.split()[:MAX_WORDS]:
+        start = lowered.index(word, start)
+        keys.append(lowered[start:start + KEY_LENGTH])
+        start += len(word)
+    return keys[:1], keys[1:]
+
+
+class SuggestIndex:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.title_starts = PrefixIndex()
+        self.title_words = PrefixIndex()
+        self.usernames = PrefixIndex()
+        self.project_titles = {}  # project id -> title
+        self.user_names = {}  # lowercased username -> username
+        self.built = False
+        self.build_lock = threading.Lock()
+        self.refresh_throttle = Throttle()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_throttle.interval = app.config.get('SUGGEST_REFRESH_INTERVAL', 30)
+        app.before_request(self.maybe_refresh)
+
+    def ensure_built(self):
+        # Called by /suggest; until then writes and catch-ups are skipped
+        if not self.built:
+            with self.build_lock:
+                if not self.built:
+                    self.build()
+                    self.refresh_throttle.postpone()
+
+    def build(self):
+        self.rowids_supported = db.engine.dialect.name == 'sqlite'
+        projects = db.session.execute(select(Project.id, Project.title)).all()
+        users = db.session.execute(select(User.id, User.username)).all()
+        watermark = self.watermarks()
+        starts, words = [], []
+        for project_id, title in projects:
+            start_keys, word_keys = title_keys(title)
+            starts.extend((key, project_id) for key in start_keys)
+            words.extend((key, project_id) for key in word_keys)
+        names = [(username.lower(), username.lower()) for _, username in users]
+        with self.lock:
+            self.title_starts.load(starts)
+            self.title_words.load(words)
+            self.usernames.load(names)
+            self.project_titles = dict(projects)
+            self.user_names = {username.lower(): username for _, username in users}
+            self.max_user_id, self.max_rowid, self.last_updated = watermark
+            self.built = True
+
+    def watermarks(self):
+        max_user_id = db.session.scalar(select(db.func.max(User.id))) or 0
+        max_rowid = db.session.scalar(select(db.func.max(literal_column('rowid'))).select_from(Project)) if self.rowids_supported else 0
+        last_updated = db.session.scalar(select(db.func.max(Project.last_updated)))
+        return max_user_id, max_rowid or 0, last_updated
+
+    def add_project(self, project_id, title):
+        if not self.built:  # The build will read it from the database
+            return
+        with self.lock:
+            old = self.project_titles.get(project_id)
+            if old == title:
+                return
+            if old is not None:
+                for index, keys in zip((self.title_starts, self.title_words), title_keys(old)):
+                    for key in keys:
+                        index.remove(key, project_id)
+            for index, keys in zip((self.title_starts, self.title_words), title_keys(title)):
+                for key in keys:
+                    index.add(key, project_id)
+            self.project_titles[project_id] = title
+
+    def add_user(self, username):
+        if not self.built:
+            return
+        with self.lock:
+            if username.lower() not in self.user_names:
+                self.usernames.add(username.lower(), username.lower())
+                self.user_names[username.lower()] = username
+
+    def maybe_refresh(self):
+        if self.built:
+            self.refresh_throttle(self.safe_refresh)
+
+    def safe_refresh(self):
+        # A failed catch-up keeps serving the current index and its watermarks,
+        # so the next interval picks up the same changes
+        try:
+            self.refresh()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception(f"Suggest index refresh failed: {e}")
+
+    def refresh(self):
+        max_user_id, max_rowid, last_updated = self.max_user_id, self.max_rowid, self.last_updated
+        watermark = self.watermarks()
+        for _, username in db.session.execute(select(User.id, User.username).where(User.id > max_user_id)):
+            self.add_user(username)
+        changed = []
+        if self.rowids_supported:
+            changed.append(literal_column('projects.rowid') > max_rowid)
+        if last_updated is not None:
+            changed.append(Project.last_updated >= last_updated)
+        if changed:
+            for project_id, title in db.session.execute(select(Project.id, Project.title).where(or_(*changed))):
+                self.add_project(project_id, title)
+        self.max_user_id, self.max_rowid, self.last_updated = watermark
+
+    def suggest_titles(self, prefix, limit):
+        prefix = prefix.lower()
+        results = []
+        seen = set()
+        with self.lock:
+            for index in (self.title_starts, self.title_words):
+                for _, project_id in index.scan(prefix):
+                    title = self.project_titles[project_id]
+                    if project_id in seen or (len(prefix) > KEY_LENGTH and prefix not in title.lower()):
+                        continue
+                    seen.add(project_id)
+                    results.append({'id': project_id, 'title': title})
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def suggest_usernames(self, prefix, limit):
+        with self.lock:
+            names = []
+            for key, _ in self.usernames.scan(prefix.lower()):
+                names.append(self.user_names[key])
+                if len(names) >= limit:
+                    break
+        return names
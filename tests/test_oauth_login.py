@@ -0,0 +1,107 @@
+# ID token verification against stub_idp.py served on a local port: a valid
+# login, and tokens with the wrong audience, expired or wrongly signed.
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+from authlib.jose import JsonWebKey, jwt
+from werkzeug.serving import make_server
+
+import stub_idp
+from app import create_app, init_db, google
+from oauth_login import OAuthError
+
+NONCE = 'test-nonce'
+
+
+@pytest.fixture
+def idp():
+    server = make_server('127.0.0.1', 0, stub_idp.create_idp('alice@example.com'), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def make_app(tmp_path, idp, client_id='stub-client'):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'SESSION_STORE_PATH': str(tmp_path / 'sessions.db'),
+        'RESPONSE_CACHE_PATH': str(tmp_path / 'cache.db'),
+        'RATELIMIT_ENABLED': False,
+        'MAIL_OUTBOX_BACKGROUND': False,
+        'UPLOAD_DIR': str(tmp_path / 'uploads'),
+        'SESSION_COOKIE_SECURE': False,  # The test client talks plain HTTP
+        'OAUTH_DISCOVERY_URL': idp + '/.well-known/openid-configuration',
+        'OAUTH_CLIENT_ID': client_id,
+        'OAUTH_CLIENT_SECRET': 'secret',
+    })
+    with app.app_context():
+        init_db()
+    return app
+
+
+def issue_id_token(idp):
+    # What the app's callback would receive from the stub's token endpoint
+    response = requests.get(idp + '/authorize', allow_redirects=False, params={
+        'redirect_uri': 'http://app.test/login/authorized', 'nonce': NONCE, 'state': 'state'})
+    code = parse_qs(urlparse(response.headers['Location']).query)['code'][0]
+    response = requests.post(idp + '/token', data={'code': code, 'client_id': 'stub-client'})
+    return response.json()['id_token']
+
+
+def test_login_with_valid_token(tmp_path, idp):
+    client = make_app(tmp_path, idp).test_client()
+
+    authorize_url = client.get('/login').headers['Location']
+    assert authorize_url.startswith(idp + '/authorize?')
+    callback = requests.get(authorize_url, allow_redirects=False).headers['Location']
+    response = client.get(callback.replace('http://localhost', ''))
+
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/ask-username')
+    with client.session_transaction() as session:
+        assert session['email'] == 'alice@example.com'
+        assert 'id_token' in session['google_token']
+
+
+def test_valid_token_is_decoded(tmp_path, idp):
+    with make_app(tmp_path, idp).app_context():
+        claims = google.decode_id_token(issue_id_token(idp), NONCE)
+    assert (claims['iss'], claims['aud'], claims['email']) == (idp, 'stub-client', 'alice@example.com')
+
+
+def test_wrong_audience_is_rejected(tmp_path, idp):
+    with make_app(tmp_path, idp, client_id='another-client').app_context():
+        with pytest.raises(OAuthError, match='aud'):
+            google.decode_id_token(issue_id_token(idp), NONCE)
+
+
+def test_expired_token_is_rejected(tmp_path, idp, monkeypatch):
+    issued = time.time() - 2 * 3600  # Expired an hour ago, well past the leeway
+    monkeypatch.setattr(stub_idp.time, 'time', lambda: issued)
+    id_token = issue_id_token(idp)
+    monkeypatch.undo()
+    with make_app(tmp_path, idp).app_context():
+        with pytest.raises(OAuthError, match='expired'):
+            google.decode_id_token(id_token, NONCE)
+
+
+def test_bad_signature_is_rejected(tmp_path, idp):
+    # The stub's claims and key id, signed with a key the stub never published
+    genuine = jwt.decode(issue_id_token(idp), JsonWebKey.import_key_set(requests.get(idp + '/jwks').json()))
+    forger = JsonWebKey.generate_key('RSA', 2048, is_private=True)
+    forged = jwt.encode({'alg': 'RS256', 'kid': 'stub-key'}, dict(genuine), forger).decode()
+    with make_app(tmp_path, idp).app_context():
+        with pytest.raises(OAuthError, match='signature'):
+            google.decode_id_token(forged, NONCE)
+
+
+def test_algorithm_not_matching_the_key_is_rejected(tmp_path, idp):
+    genuine = jwt.decode(issue_id_token(idp), JsonWebKey.import_key_set(requests.get(idp + '/jwks').json()))
+    forged = jwt.encode({'alg': 'HS256', 'kid': 'stub-key'}, dict(genuine), b'0' * 32).decode()
+    with make_app(tmp_path, idp).app_context():
+        with pytest.raises(OAuthError):
+            google.decode_id_token(forged, NONCE)
@@ -0,0 +1,154 @@
+# The mail outbox against a local SMTP server: delivery, per-message failures
+# with backoff, and reclaiming rows whose sender died holding the lease.
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask_mail import Message
+
+from app import create_app, init_db, mail_outbox
+from classes import db, OutboxMessage
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib; recipients at reject.example are refused
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 stub ready')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stub')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 ok')
+            elif command == 'RCPT':
+                if 'reject.example' in line:
+                    self.reply('550 no such user')
+                else:
+                    recipients.append(line.split(':', 1)[1].strip(' <>'))
+                    self.reply('250 ok')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                data = b''.join(iter(lambda: self.rfile.readline(), b'.\r\n'))
+                self.server.delivered.append((recipients, data))
+                self.reply('250 queued')
+            else:  # RSET, NOOP
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.delivered = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def app(tmp_path, smtp_server):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'SESSION_STORE_PATH': str(tmp_path / 'sessions.db'),
+        'RESPONSE_CACHE_PATH': str(tmp_path / 'cache.db'),
+        'RATELIMIT_ENABLED': False,
+        'UPLOAD_DIR': str(tmp_path / 'uploads'),
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': smtp_server.server_address[1],
+        'MAIL_USE_TLS': False,
+        'MAIL_USERNAME': None,
+        'MAIL_PASSWORD': None,
+        'MAIL_OUTBOX_BACKGROUND': False,  # The tests call send_batch themselves
+        'MAIL_OUTBOX_BACKOFF': 30,
+        'MAIL_OUTBOX_MAX_ATTEMPTS': 3,
+    })
+    with app.app_context():
+        init_db()
+        yield app
+        db.engine.dispose()
+
+
+def enqueue(recipient):
+    message = Message(subject=f'Hello {recipient}', sender='noreply@example.com',
+                      recipients=[recipient], body='Hi there')
+    return mail_outbox.enqueue(message).id
+
+
+def make_due(message_id):
+    OutboxMessage.query.filter_by(id=message_id).update(
+        {OutboxMessage.next_attempt_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+
+def test_delivers_pending_messages(app, smtp_server):
+    ids = [enqueue(f'user{i}@example.com') for i in range(3)]
+
+    assert mail_outbox.send_batch() == 3
+
+    assert sorted(recipients[0] for recipients, _ in smtp_server.delivered) == [
+        'user0@example.com', 'user1@example.com', 'user2@example.com']
+    for message_id in ids:
+        entry = db.session.get(OutboxMessage, message_id)
+        assert (entry.status, entry.attempts, entry.last_error) == ('sent', 1, None)
+        assert entry.sent_at is not None
+    assert mail_outbox.send_batch() == 0
+
+
+def test_rejected_message_backs_off_without_blocking_others(app, smtp_server):
+    rejected = enqueue('nobody@reject.example')
+    accepted = enqueue('user@example.com')
+
+    before = datetime.utcnow()
+    assert mail_outbox.send_batch() == 2
+
+    assert [recipients for recipients, _ in smtp_server.delivered] == [['user@example.com']]
+    assert db.session.get(OutboxMessage, accepted).status == 'sent'
+    entry = db.session.get(OutboxMessage, rejected)
+    assert (entry.status, entry.attempts) == ('pending', 1)
+    assert '550' in entry.last_error
+    assert before + timedelta(seconds=29) < entry.next_attempt_at < datetime.utcnow() + timedelta(seconds=31)
+
+    # Not retried before the backoff has passed
+    assert mail_outbox.send_batch() == 0
+
+    # The delay doubles with each attempt, and the last one gives up
+    make_due(rejected)
+    before = datetime.utcnow()
+    assert mail_outbox.send_batch() == 1
+    entry = db.session.get(OutboxMessage, rejected)
+    assert (entry.status, entry.attempts) == ('pending', 2)
+    assert before + timedelta(seconds=59) < entry.next_attempt_at < datetime.utcnow() + timedelta(seconds=61)
+
+    make_due(rejected)
+    assert mail_outbox.send_batch() == 1
+    entry = db.session.get(OutboxMessage, rejected)
+    assert (entry.status, entry.attempts) == ('failed', 3)
+    assert len(smtp_server.delivered) == 1
+
+
+def test_expired_lease_is_reclaimed(app, smtp_server):
+    message_id = enqueue('user@example.com')
+
+    # A sender claims the message and dies before sending it
+    assert [entry.id for entry in mail_outbox.claim_batch()] == [message_id]
+    assert mail_outbox.send_batch() == 0
+    assert smtp_server.delivered == []
+
+    make_due(message_id)  # The lease runs out
+    assert mail_outbox.send_batch() == 1
+
+    assert len(smtp_server.delivered) == 1
+    entry = db.session.get(OutboxMessage, message_id)
+    assert (entry.status, entry.attempts) == ('sent', 1)
@@ -0,0 +1,79 @@
+# The JSON listing endpoints must issue the same number of SQL statements
+# however many projects, collaborators and milestones a page holds (no N+1).
+import pytest
+from sqlalchemy import event
+
+from app import create_app, init_db, response_cache
+from classes import db, User, Project, Milestone
+
+N = 5
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'SESSION_STORE_PATH': str(tmp_path / 'sessions.db'),
+        'RESPONSE_CACHE_PATH': str(tmp_path / 'cache.db'),
+        'RATELIMIT_ENABLED': False,
+        'MAIL_OUTBOX_BACKGROUND': False,  # Its thread would run queries during the requests
+        'UPLOAD_DIR': str(tmp_path / 'uploads'),
+    })
+    with app.app_context():
+        init_db()
+        users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def add_projects(app, count):
+    with app.app_context():
+        users = User.query.order_by(User.id).all()
+        start = Project.query.count()
+        for i in range(start, start + count):
+            project = Project(title=f'Widget {i}', description=f'Project number {i}', owner=users[0].username)
+            project.users.extend(users[:1 + i % len(users)])
+            db.session.add(project)
+            db.session.flush()
+            db.session.add_all(Milestone(f'Step {m}', project.id) for m in range(1 + i % 3))
+        db.session.commit()
+    response_cache.invalidate('projects')
+
+
+def count_statements(app, client, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(response.get_json()), len(statements)
+
+
+@pytest.mark.parametrize('url', [
+    '/load-more-projects?initialLoad=true',
+    '/load-more-projects?initialLoad=true&fields=card',
+    '/search?q=widget&limit=1000',
+])
+def test_statement_count_does_not_grow_with_results(app, url):
+    client = app.test_client()
+    add_projects(app, N)
+    client.get('/')  # Interval-gated refreshes run on the first request
+
+    small_results, small = count_statements(app, client, url)
+    add_projects(app, 9 * N)
+    large_results, large = count_statements(app, client, url)
+
+    assert small_results == N
+    assert large_results > small_results
+    assert large == small
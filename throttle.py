@@ -0,0 +1,30 @@
+import threading
+import time
+
+# Runs periodic work (catch-up queries, sweeps) from a hot path such as a
+# before_request hook: most calls cost one float comparison, and the work runs
+# at most once per interval per process, in one thread at a time. A thread that
+# finds it already running moves on instead of waiting.
+
+
+class Throttle:
+    def __init__(self, interval=0):
+        self.interval = interval
+        self.next_run = 0
+        self.lock = threading.Lock()
+
+    def postpone(self):
+        # The work was just done some other way; wait a full interval
+        self.next_run = time.monotonic() + self.interval
+
+    def __call__(self, func):
+        # Returns whether func ran
+        now = time.monotonic()
+        if now < self.next_run or not self.lock.acquire(blocking=False):
+            return False
+        try:
+            self.next_run = now + self.interval
+            func()
+            return True
+        finally:
+            self.lock.release()
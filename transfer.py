@@ -0,0 +1,262 @@
+import hashlib
+import json
+from datetime import datetime
+from sqlalchemy import select, insert
+from classes import db, User, Project, Milestone, project_users, isoformat
+from progress import refresh_progress
+from profiles import refresh_user_counts
+
+# NDJSON export and import of the whole project dataset, one project per line
+# with its collaborators and milestones inline:
+#
+#   {"id": ..., "title": ..., "description": ..., "owner": ..., "images": ...,
+#    "category": ..., "date_created": ..., "deadline": ..., "last_updated": ...,
+#    "users": [{"username": ..., "email": ...}, ...],
+#    "milestones": [{"description": ..., "deadline": ..., "completed": ..., "completed_date": ...}, ...]}
+#
+# export_projects() streams projects off one cursor with yield_per and fetches
+# collaborators and milestones per batch with IN queries, so memory stays
+# bounded by BATCH_SIZE however large the table is. import_projects() reads
+# lines lazily, validates each record and writes every batch in its own
+# transaction with executemany INSERTs. Projects whose id already exists are
+# skipped, so an interrupted import can simply be run again.
+
+BATCH_SIZE = 1000
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def export_projects(batch_size=BATCH_SIZE):
+    # Generator of NDJSON lines; needs an app context for as long as it runs
+    projects = Project.__table__
+    result = db.session.execute(
+        select(projects.c.id, projects.c.title, projects.c.description, projects.c.owner,
+               projects.c.project_images, projects.c.category, projects.c.date_created,
+               projects.c.deadline, projects.c.last_updated).order_by(projects.c.id),
+        execution_options={'yield_per': batch_size},
+    )
+    for rows in result.partitions():
+        ids = [row.id for row in rows]
+        users = {pid: [] for pid in ids}
+        milestones = {pid: [] for pid in ids}
+        members = db.session.execute(
+            select(project_users.c.project_id, User.username, User.email)
+            .join(User, User.id == project_users.c.user_id)
+            .where(project_users.c.project_id.in_(ids))
+            .order_by(project_users.c.project_id, project_users.c.joined_at)
+        )
+        for project_id, username, email in members:
+            users[project_id].append({'username': username, 'email': email})
+        for m in db.session.execute(
+            select(Milestone.project_id, Milestone.description, Milestone.deadline,
+                   Milestone.completed, Milestone.completed_date)
+            .where(Milestone.project_id.in_(ids)).order_by(Milestone.id)
+        ):
+            milestones[m.project_id].append({
+                'description': m.description,
+                'deadline': isoformat(m.deadline),
+                'completed': bool(m.completed),
+                'completed_date': isoformat(m.completed_date),
+            })
+        chunk = []
+        for row in rows:
+            chunk.append(json.dumps({
+                'id': row.id,
+                'title': row.title,
+                'description': row.description,
+                'owner': row.owner,
+                'images': row.project_images or '',
+                'category': row.category,
+                'date_created': isoformat(row.date_created),
+                'deadline': isoformat(row.deadline),
+                'last_updated': isoformat(row.last_updated),
+                'users': users[row.id],
+                'milestones': milestones[row.id],
+            }, separators=(',', ':')) + '\n')
+        yield ''.join(chunk)
+
+
+def parse_datetime(record, field):
+    value = record.get(field)
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise InvalidRecord(f'{field} must be an ISO date string')
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidRecord(f'{field} is not an ISO date: {value!r}')
+
+
+def required_string(record, field, max_length=None):
+    value = record.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise InvalidRecord(f'{field} is required')
+    if max_length and len(value) > max_length:
+        raise InvalidRecord(f'{field} is longer than {max_length} characters')
+    return value
+
+
+# Turns one decoded line into (project row, [(username, email)], [milestone rows])
+def validate(record):
+    if not isinstance(record, dict):
+        raise InvalidRecord('not a JSON object')
+    title = required_string(record, 'title', 150)
+    description = required_string(record, 'description')
+    owner = required_string(record, 'owner', 80)
+    project_id = record.get('id') or hashlib.sha256(f"{title}{owner}{description}".encode()).hexdigest()
+    if not isinstance(project_id, str) or len(project_id) > 64:
+        raise InvalidRecord('id must be a string of at most 64 characters')
+    images = record.get('images') or ''
+    category = record.get('category')
+    if not isinstance(images, str) or not (category is None or isinstance(category, str)):
+        raise InvalidRecord('images and category must be strings')
+    date_created = parse_datetime(record, 'date_created')
+    project = {
+        'id': project_id,
+        'title': title,
+        'description': description,
+        'owner': owner,
+        'project_images': images,
+        'category': category,
+        'date_created': date_created or datetime.utcnow(),
+        'deadline': parse_datetime(record, 'deadline'),
+        'last_updated': parse_datetime(record, 'last_updated') or date_created or datetime.utcnow(),
+    }
+
+    users = []
+    for user in record.get('users') or []:
+        if not isinstance(user, dict):
+            raise InvalidRecord('users must be objects with username and email')
+        users.append((required_string(user, 'username', 80), required_string(user, 'email', 120)))
+
+    milestones = []
+    for milestone in record.get('milestones') or []:
+        if not isinstance(milestone, dict):
+            raise InvalidRecord('milestones must be objects')
+        milestones.append({
+            'project_id': project_id,
+            'description': required_string(milestone, 'description'),
+            'deadline': parse_datetime(milestone, 'deadline'),
+            'completed': bool(milestone.get('completed')),
+            'completed_date': parse_datetime(milestone, 'completed_date'),
+        })
+    return project, users, milestones
+
+
+class ImportStats:
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.skipped = 0  # Already present
+        self.invalid = 0
+        self.users_created = 0
+
+    def __str__(self):
+        return (f"{self.lines} lines: {self.imported} imported, {self.skipped} already present, "
+                f"{self.invalid} invalid, {self.users_created} users created")
+
+
+def import_projects(lines, batch_size=BATCH_SIZE, on_error=None, on_progress=None):
+    # `lines` is any iterable of NDJSON lines (e.g. an open file); on_error is
+    # called with (line_number, message) and on_progress with the stats after
+    # every committed batch
+    stats = ImportStats()
+    batch = []
+    for number, line in enumerate(lines, 1):
+        stats.lines = number
+        if not line.strip():
+            continue
+        try:
+            batch.append((number, *validate(json.loads(line))))
+        except (ValueError, InvalidRecord) as e:
+            stats.invalid += 1
+            if on_error:
+                on_error(number, str(e))
+            continue
+        if len(batch) >= batch_size:
+            write_batch(batch, stats, on_error)
+            if on_progress:
+                on_progress(stats)
+            batch = []
+    if batch:
+        write_batch(batch, stats, on_error)
+        if on_progress:
+            on_progress(stats)
+    return stats
+
+
+def write_batch(batch, stats, on_error=None):
+    try:
+        # Later duplicates of an id within the batch are skipped like existing ones
+        records = {}
+        lines = {}
+        for number, project, users, milestones in batch:
+            if project['id'] in records:
+                stats.skipped += 1
+            else:
+                records[project['id']] = (project, users, milestones)
+                lines[project['id']] = number
+        existing = set(db.session.execute(select(Project.id).where(Project.id.in_(list(records)))).scalars())
+        stats.skipped += len(existing)
+        records = [record for project_id, record in records.items() if project_id not in existing]
+        if not records:
+            db.session.rollback()
+            return
+
+        # Collaborators are matched by username and created when missing, unless
+        # their email already belongs to another user
+        emails = {}
+        for _, users, _ in records:
+            for username, email in users:
+                emails.setdefault(username, email)
+        user_ids = dict(db.session.execute(select(User.username, User.id).where(User.username.in_(list(emails)))).all())
+        # Emails are unique too: of several new collaborators sharing one, only
+        # the first is created
+        wanted = {}
+        duplicates = {}
+        for name, email in emails.items():
+            if name in user_ids:
+                continue
+            if email in wanted:
+                duplicates[name] = wanted[email]
+            else:
+                wanted[email] = name
+        taken = set(db.session.execute(select(User.email).where(User.email.in_(list(wanted)))).scalars())
+        missing = [{'username': name, 'email': email} for email, name in wanted.items() if email not in taken]
+        if (taken or duplicates) and on_error:
+            for project, users, _ in records:
+                for username, email in users:
+                    if username in user_ids:
+                        continue
+                    if email in taken:
+                        on_error(lines[project['id']], f'collaborator {username} left out: {email} belongs to another user')
+                    elif username in duplicates:
+                        on_error(lines[project['id']], f'collaborator {username} left out: {email} is also the email of '
+                                                       f'new collaborator {duplicates[username]}')
+        if missing:
+            created = db.session.execute(insert(User.__table__).returning(User.id, User.username), missing)
+            user_ids.update({username: user_id for user_id, username in created})
+            stats.users_created += len(missing)
+
+        db.session.execute(insert(Project.__table__), [project for project, _, _ in records])
+        members = [
+            {'project_id': project['id'], 'user_id': user_ids[username], 'joined_at': project['date_created']}
+            for project, users, _ in records for username in dict.fromkeys(name for name, _ in users)
+            if username in user_ids
+        ]
+        if members:
+            db.session.execute(insert(project_users), members)
+        milestones = [row for _, _, rows in records for row in rows]
+        if milestones:
+            db.session.execute(insert(Milestone.__table__), milestones)
+
+        refresh_progress(project['id'] for project, _, _ in records)
+        refresh_user_counts(user_ids.values())
+        db.session.commit()
+        stats.imported += len(records)
+    except Exception:
+        db.session.rollback()
+        raise
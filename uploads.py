@@ -0,0 +1,174 @@
+import fcntl
+import json
+import os
+import re
+import secrets
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
+from images import CHUNK_SIZE, SNIFF_LENGTH, InvalidImage, sniff_image_type
+
+# Resumable chunked uploads for large images, used by static/uploads.js.
+#
+#   POST  /uploads        {"size": <bytes>}      -> 201 {"id", "offset": 0, "size", "chunk_size"}
+#   PATCH /uploads/<id>   Upload-Offset: <n>     raw bytes from offset n
+#   GET   /uploads/<id>                          -> {"id", "offset", "size"[, "filename"]}
+#
+# Data is appended to UPLOAD_DIR/.incoming/<id>.part straight from the request
+# stream, so an interrupted request keeps everything that arrived and the
+# client resumes from the offset GET reports. A PATCH whose offset is not the
+# current end of the file (a retry of a request that did get through, or two
+# tabs uploading the same file) is answered with 409 and the current offset.
+# The part that brings the file to its announced size moves it into the
+# upload directory under its content address (ImagePipeline.store_file);
+# post_project and edit_project then attach it by upload id.
+#
+# An upload belongs to the user who created it. Uploads that are neither
+# completed nor attached are removed UPLOAD_EXPIRY seconds after they were
+# started.
+
+UPLOAD_ID_RE = re.compile(r'^[A-Za-z0-9_-]{24}$')
+
+
+class UploadConflict(Exception):
+    def __init__(self, offset):
+        super().__init__(f'Upload is at offset {offset}')
+        self.offset = offset
+
+
+class ResumableUploads:
+    def __init__(self, app=None, pipeline=None):
+        self.pipeline = None
+        if app is not None:
+            self.init_app(app, pipeline)
+
+    def init_app(self, app, pipeline):
+        self.pipeline = pipeline
+        self.directory = os.path.join(app.config['UPLOAD_DIR'], '.incoming')
+        self.chunk_size = app.config.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+        self.expiry = app.config.get('UPLOAD_EXPIRY', 24 * 3600)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def paths(self, upload_id):
+        base = os.path.join(self.directory, upload_id)
+        return base + '.part', base + '.json'
+
+    def load(self, upload_id, owner):
+        # The upload's metadata, or None when it does not exist for this user
+        if not UPLOAD_ID_RE.match(upload_id or ''):
+            return None
+        try:
+            with open(self.paths(upload_id)[1]) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if meta['owner'] == owner else None
+
+    def save_meta(self, upload_id, meta):
+        path = self.paths(upload_id)[1]
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    def create(self, size, owner):
+        if size > self.pipeline.max_file_size:
+            raise RequestEntityTooLarge(f'Each image may be at most {self.pipeline.max_file_size // (1024 * 1024)} MB.')
+        self.purge()
+        upload_id = secrets.token_urlsafe(18)
+        meta = {'size': size, 'owner': owner, 'created': time.time(), 'filename': None}
+        self.save_meta(upload_id, meta)
+        open(self.paths(upload_id)[0], 'xb').close()
+        return dict(self.describe(upload_id, meta, 0), chunk_size=self.chunk_size)
+
+    def describe(self, upload_id, meta, offset):
+        status = {'id': upload_id, 'offset': offset, 'size': meta['size']}
+        if meta['filename']:
+            status['filename'] = meta['filename']
+        return status
+
+    def status(self, upload_id, owner):
+        meta = self.load(upload_id, owner)
+        if meta is None:
+            return None
+        if meta['filename']:
+            return self.describe(upload_id, meta, meta['size'])
+        return self.describe(upload_id, meta, os.path.getsize(self.paths(upload_id)[0]))
+
+    def append(self, upload_id, owner, offset, stream):
+        # Writes the request body at `offset`; returns the new status, or None
+        # for an unknown upload. Raises UploadConflict, RequestEntityTooLarge
+        # (more data than announced) and InvalidImage.
+        meta = self.load(upload_id, owner)
+        if meta is None:
+            return None
+        if meta['filename']:
+            raise UploadConflict(meta['size'])
+        part, _ = self.paths(upload_id)
+        try:
+            f = open(part, 'r+b')
+        except FileNotFoundError:
+            raise UploadConflict(meta['size'])  # Completed by a concurrent request
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict(os.fstat(f.fileno()).st_size)  # Another request is appending
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadConflict(current)
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if current + len(chunk) > meta['size']:
+                    raise RequestEntityTooLarge('More data than the announced upload size.')
+                if current < SNIFF_LENGTH:
+                    # Refuse anything that is not an image with its first bytes
+                    header = self.read_header(f, current) + chunk[:SNIFF_LENGTH - current]
+                    if len(header) >= min(SNIFF_LENGTH, meta['size']) and sniff_image_type(header) is None:
+                        self.remove(upload_id)
+                        raise InvalidImage('Not a PNG, JPEG, GIF or WebP image')
+                f.write(chunk)
+                current += len(chunk)
+            f.flush()
+            if current < meta['size']:
+                return self.describe(upload_id, meta, current)
+            try:
+                meta['filename'] = self.pipeline.store_file(part)
+            except InvalidImage:
+                self.remove(upload_id)
+                raise
+        self.save_meta(upload_id, meta)
+        return self.describe(upload_id, meta, meta['size'])
+
+    def read_header(self, f, length):
+        f.seek(0)
+        header = f.read(length)
+        f.seek(length)
+        return header
+
+    def claim(self, upload_id, owner):
+        # Filename of a completed upload, which is forgotten once attached
+        meta = self.load(upload_id, owner)
+        if meta is None or not meta['filename']:
+            return None
+        self.remove(upload_id)
+        return meta['filename']
+
+    def remove(self, upload_id):
+        for path in self.paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def purge(self):
+        # Metadata is written when an upload starts and when it completes
+        cutoff = time.time() - self.expiry
+        for name in os.listdir(self.directory):
+            upload_id, ext = os.path.splitext(name)
+            path = os.path.join(self.directory, name)
+            try:
+                if ext == '.json' and os.path.getmtime(path) < cutoff:
+                    self.remove(upload_id)
+                elif ext == '.part' and not os.path.exists(self.paths(upload_id)[1]):
+                    os.remove(path)
+            except OSError:
+                pass  # Removed by another worker
@@ -0,0 +1,15 @@
+from app import create_app, warm_up
+
+# Entry point for production servers:
+#
+#   flask --app app db upgrade         # existing databases, when a release adds migrations
+#   flask --app app init-db            # every deploy; creates whatever is missing
+#   gunicorn --preload -w 4 wsgi:app
+#
+# With --preload the app is created and warmed up once in the master process
+# and every worker is forked from it, sharing the imported modules, compiled
+# templates and the typeahead index instead of building its own. Database
+# pools and SQLite connections are reopened in each worker after the fork.
+
+app = create_app()
+warm_up(app)